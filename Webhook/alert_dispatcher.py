@@ -0,0 +1,86 @@
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+
+class AlertDispatcher:
+    """Send alerts off the monitoring loop, optionally batched per user.
+
+    send_digest(user_id, entries) runs on a small worker pool, so a slow
+    LLM reply never delays the next sensor update. With window_seconds 0
+    (the default) every alert is sent on its own.
+
+    With a window, the first alert for a user starts a window_seconds
+    timer. Alerts that arrive before it fires are added to the same
+    digest, with a newer alert for a plant replacing the older one. This
+    only merges anything once a user can have several plants; with one
+    plant per user, no plant is checked twice within a short window.
+    """
+
+    def __init__(self, send_digest, window_seconds=0, workers=4):
+        self.send_digest = send_digest
+        self.window_seconds = window_seconds
+        self._pending = {}
+        self._timers = {}
+        self._in_flight = set()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='alerts')
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self):
+        """Number of users with a digest waiting to be sent"""
+        return len(self._pending)
+
+    def add(self, user_id, plant_id, entry):
+        """Queue an alert entry for one of the user's plants"""
+        if self.window_seconds <= 0:
+            self._submit(user_id, [entry])
+            return
+
+        with self._lock:
+            self._pending.setdefault(user_id, {})[plant_id] = entry
+            if user_id not in self._timers:
+                timer = threading.Timer(self.window_seconds, self.flush, args=(user_id,))
+                timer.daemon = True
+                self._timers[user_id] = timer
+                timer.start()
+
+    def flush(self, user_id):
+        """Send the pending digest of a user right away"""
+        with self._lock:
+            timer = self._timers.pop(user_id, None)
+            entries = self._pending.pop(user_id, None)
+        if timer:
+            timer.cancel()
+        if entries:
+            self._submit(user_id, list(entries.values()))
+
+    def flush_all(self):
+        with self._lock:
+            user_ids = list(self._pending)
+        for user_id in user_ids:
+            self.flush(user_id)
+
+    def wait(self, timeout=None):
+        """Wait for the digests handed to the workers so far to be sent"""
+        with self._lock:
+            futures = list(self._in_flight)
+        wait(futures, timeout=timeout)
+
+    def _submit(self, user_id, entries):
+        future = self._executor.submit(self._send, user_id, entries)
+        with self._lock:
+            self._in_flight.add(future)
+        future.add_done_callback(self._done)
+
+    def _done(self, future):
+        with self._lock:
+            self._in_flight.discard(future)
+
+    def _send(self, user_id, entries):
+        try:
+            self.send_digest(user_id, entries)
+        except Exception as e:
+            logger.error(f"Error sending alert digest to {user_id}: {str(e)}")
@@ -0,0 +1,174 @@
+import json
+import os
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class MetricAlert:
+    """Alert state of one metric of one plant: 'pending', 'alerting' or 'ok' (cooling down)"""
+
+    __slots__ = ('state', 'condition', 'since', 'fired_at')
+
+    def __init__(self, state, condition, since, fired_at=None):
+        self.state = state
+        self.condition = condition
+        self.since = since
+        self.fired_at = fired_at
+
+    def to_list(self):
+        return [self.state, self.condition, self.since, self.fired_at]
+
+
+class AlertStates:
+    """Per plant and metric alert state machine with hysteresis, dwell time and cooldown.
+
+    A metric out of range becomes 'pending' and only alerts once it has
+    been out for dwell_seconds, counted from the last reading that was in
+    range. A pending metric that comes back in range is dropped without an
+    alert. An alerting metric stays quiet until its value is back inside
+    the range by a hysteresis band (a fraction of the range width), so
+    values hovering at a boundary alert once. A metric that alerted will
+    not alert again for cooldown_seconds. While it stays out of range, a
+    reminder is sent every remind_seconds.
+
+    States live in memory and are checkpointed to a JSON file at most
+    every checkpoint_seconds, so a restart loses at most that much.
+    """
+
+    def __init__(self, path, hysteresis=0.05, dwell_seconds=300, cooldown_seconds=3600,
+                 remind_seconds=12 * 3600, checkpoint_seconds=300):
+        self.path = path
+        self.hysteresis = hysteresis
+        self.dwell_seconds = dwell_seconds
+        self.cooldown_seconds = cooldown_seconds
+        self.remind_seconds = remind_seconds
+        self.checkpoint_seconds = checkpoint_seconds
+        self._states = {}
+        self._last_seen = {}
+        self._dirty = False
+        self._last_checkpoint = time.time()
+        self._lock = threading.Lock()
+        self._load()
+
+    def __contains__(self, plant_id):
+        return bool(self._states.get(plant_id))
+
+    def active_metrics(self, plant_id):
+        """Metrics of a plant that are pending or alerting"""
+        return {metric for metric, alert in self._states.get(plant_id, {}).items() if alert.state != 'ok'}
+
+    def seen(self, plant_id, ts):
+        """Record when a plant was last read.
+
+        observe() only runs for plants with a breach or an open state, so
+        the caller reports every reading here; a first bad reading after a
+        calm stretch then counts its dwell from the reading just before it.
+        """
+        self._last_seen[plant_id] = ts
+
+    def observe(self, plant_id, ts, reading, breaches, thresholds):
+        """Advance the plant's states with a reading and its (metric, condition) breaches.
+
+        Returns the (metric, condition) pairs to alert about now.
+        """
+        breached = dict(breaches)
+        fired = []
+        with self._lock:
+            states = self._states.setdefault(plant_id, {})
+            previous_ts = self._last_seen.get(plant_id, ts)
+            self._last_seen[plant_id] = ts
+
+            for metric in set(breached) | set(states):
+                alert = states.get(metric)
+                condition = breached.get(metric)
+
+                if condition:
+                    if alert is None or alert.state == 'ok' or alert.condition != condition:
+                        # Out since the last reading that was not
+                        alert = states[metric] = MetricAlert(
+                            'pending', condition, previous_ts, alert.fired_at if alert else None
+                        )
+                        self._dirty = True
+                    if alert.state == 'pending':
+                        cooled_down = alert.fired_at is None or ts - alert.fired_at >= self.cooldown_seconds
+                        if ts - alert.since >= self.dwell_seconds and cooled_down:
+                            alert.state = 'alerting'
+                            alert.fired_at = ts
+                            fired.append((metric, condition))
+                            self._dirty = True
+                    elif self.remind_seconds and ts - alert.fired_at >= self.remind_seconds:
+                        alert.fired_at = ts
+                        fired.append((metric, condition))
+                        self._dirty = True
+                    continue
+
+                if alert.state == 'pending':
+                    alert.state = 'ok'
+                    self._dirty = True
+                elif alert.state == 'alerting' and self._cleared(alert, reading.get(metric), (thresholds or {}).get(metric)):
+                    alert.state = 'ok'
+                    self._dirty = True
+
+                if alert.state == 'ok' and (alert.fired_at is None or ts - alert.fired_at >= self.cooldown_seconds):
+                    del states[metric]
+                    self._dirty = True
+
+            if not states:
+                del self._states[plant_id]
+        return fired
+
+    def _cleared(self, alert, value, limits):
+        """Whether an alerting metric is back in range by the hysteresis band"""
+        if not limits:
+            return True
+        if not isinstance(value, (int, float)):
+            return False
+        band = self.hysteresis * (limits['max'] - limits['min'])
+        if alert.condition == 'low':
+            return value >= limits['min'] + band
+        return value <= limits['max'] - band
+
+    def remove(self, plant_id):
+        with self._lock:
+            if self._states.pop(plant_id, None):
+                self._dirty = True
+            self._last_seen.pop(plant_id, None)
+
+    def checkpoint(self, force=False):
+        """Write the states to disk if they changed and the checkpoint interval has passed"""
+        now = time.time()
+        if not self._dirty or (not force and now - self._last_checkpoint < self.checkpoint_seconds):
+            return False
+        with self._lock:
+            data = {
+                plant_id: {metric: alert.to_list() for metric, alert in states.items()}
+                for plant_id, states in self._states.items()
+            }
+            self._dirty = False
+        self._last_checkpoint = now
+
+        tmp_path = f'{self.path}.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            self._dirty = True
+            logger.error(f"Error checkpointing alert states: {str(e)}")
+            return False
+        return True
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except ValueError as e:
+            logger.error(f"Could not read alert states: {str(e)}")
+            return
+        for plant_id, states in data.items():
+            self._states[plant_id] = {metric: MetricAlert(*values) for metric, values in states.items()}
@@ -1,25 +1,44 @@
-from flask import Flask, request, abort
+from flask import Flask, Response, request, abort
 from linebot.v3 import WebhookHandler
-from linebot.v3.messaging import Configuration, ApiClient, MessagingApi, MessagingApiBlob
+from linebot.v3.messaging import Configuration, ApiClient, MessagingApi
 from linebot.v3.webhooks import MessageEvent, ImageMessageContent, TextMessageContent
 from linebot.v3.messaging import TextMessage
 from linebot.v3.exceptions import InvalidSignatureError
 import os
 from dotenv import load_dotenv
 import tempfile
-from datetime import datetime, timedelta
+from datetime import datetime
 import logging
 import json
-import requests
-import base64
-from groq import Groq
 import asyncio
 import threading
-from bleak import BleakClient, BleakScanner
-import struct
+import queue
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import time
-from bleak.exc import BleakDBusError
+from reading_store import ReadingStore
+from rollups import RollupStore, DAY
+from reading_history import ReadingHistory
+from threshold_cache import ThresholdCache, parse_thresholds
+from job_queue import JobQueue
+from clients import DeadlineExceeded, chat_completion, get_stream, observed_call, post_json
+from plantid_cache import PlantIdCache
+from ble_hub import BleHub
+from threshold_evaluator import ThresholdMatrix
+from trends import TrendTracker
+from scheduler import DueScheduler
+from alert_dispatcher import AlertDispatcher
+from alert_state import AlertStates
+from line_dispatcher import LineDispatcher
+from state_store import PlantStateStore
+from session_store import create_session_store
+from image_store import ImageStore
+from image_preprocess import ImagePreprocessor
+from task_graph import TaskGraph
+import fallback_messages
+import metrics
+import tracing
+from profiler import SamplingProfiler, install_toggle
 
 # Set up logging
 logging.basicConfig(
@@ -33,14 +52,19 @@ load_dotenv()
 
 app = Flask(__name__)
 
+# Base URLs of the external APIs; overridable to point the bot at local stand-ins
+# (Groq reads GROQ_BASE_URL itself)
+LINE_API_URL = os.getenv('LINE_API_URL', 'https://api.line.me')
+LINE_DATA_API_URL = os.getenv('LINE_DATA_API_URL', 'https://api-data.line.me')
+PLANTID_API_URL = os.getenv('PLANTID_API_URL', 'https://api.plant.id/v2')
+
 # LINE API v3 setup
-configuration = Configuration(access_token=os.getenv('CHANNEL_ACCESS_TOKEN'))
+configuration = Configuration(host=LINE_API_URL, access_token=os.getenv('CHANNEL_ACCESS_TOKEN'))
 handler = WebhookHandler(os.getenv('CHANNEL_SECRET'))
 
 # Create API clients
 api_client = ApiClient(configuration)
 line_bot_api = MessagingApi(api_client)
-blob_api = MessagingApiBlob(api_client)
 
 # Create directories for storing images and user data
 UPLOAD_FOLDER = os.path.join(os.getcwd(), 'plant_images')
@@ -49,68 +73,187 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(USER_DATA_FOLDER, exist_ok=True)
 logger.info(f"Images will be saved to: {UPLOAD_FOLDER}")
 
-# Store user states
-user_states = {}
+# Plant.id payloads are downscaled and encoded in worker processes; the pool is
+# started before any other background thread so forking it is safe
+image_preprocessor = ImagePreprocessor(workers=int(os.getenv('IMAGE_PREPROCESS_WORKERS', '2')))
+image_preprocessor.start()
 
-# Bluetooth characteristics UUIDs
-TEMP_CHARACTERISTIC_UUID = "00002a6e-0000-1000-8000-00805f9b34fb"
-HUMIDITY_CHARACTERISTIC_UUID = "00002a6f-0000-1000-8000-00805f9b34fb"
-SOIL_MOISTURE_CHARACTERISTIC_UUID = "00002a70-0000-1000-8000-00805f9b34fb"
+# Photos are stored once per content hash and expire after a week or past the quota
+image_store = ImageStore(
+    UPLOAD_FOLDER,
+    max_bytes=int(os.getenv('IMAGE_STORE_MAX_MB', '500')) * 1024 * 1024
+)
+image_store.start_sweeper()
+
+# Append-only reading log, kept outside the per-user plant data files
+reading_store = ReadingStore(os.path.join(USER_DATA_FOLDER, 'readings'))
+
+# Compact in-memory 7-day history per user, warmed from the reading log
+reading_histories = {}
+
+# Species-keyed thresholds, shared by every user and worker process
+threshold_cache = ThresholdCache(os.path.join(USER_DATA_FOLDER, 'threshold_cache.sqlite3'))
+THRESHOLD_METRICS = ('temperature', 'humidity', 'moisture')
+# Name identify_plant falls back to; it is not a species, so its thresholds are never cached
+UNKNOWN_PLANT = "Unknown Plant"
+
+# Hourly and daily min/max/mean per plant, kept far longer than the reading log
+rollup_store = RollupStore(os.path.join(USER_DATA_FOLDER, 'rollups.sqlite3'), THRESHOLD_METRICS)
+
+# Thresholds of every plant, evaluated in one vectorized pass per tick
+threshold_matrix = ThresholdMatrix(THRESHOLD_METRICS)
+
+# Moisture and temperature trends per plant, warning before a range is left
+trend_tracker = TrendTracker(half_life=float(os.getenv('TREND_HALF_LIFE_HOURS', '3')) * 3600)
+FORECAST_HORIZON = float(os.getenv('FORECAST_HORIZON_HOURS', '12')) * 3600
+# A warning is only forgotten once its ETA is this much past the horizon, so it does not flap
+FORECAST_FORGET_HORIZON = FORECAST_HORIZON * (1 + float(os.getenv('FORECAST_FORGET_MARGIN', '0.5')))
+# (metric, condition) forecasts each user was already warned about
+forecast_warnings = {}
+
+# Alert state per plant and metric, held in memory and checkpointed every few minutes
+alert_states = AlertStates(
+    os.path.join(USER_DATA_FOLDER, 'alert_states.json'),
+    hysteresis=float(os.getenv('ALERT_HYSTERESIS', '0.05')),
+    dwell_seconds=float(os.getenv('ALERT_DWELL_MINUTES', '5')) * 60,
+    cooldown_seconds=float(os.getenv('ALERT_COOLDOWN_MINUTES', '60')) * 60,
+    remind_seconds=float(os.getenv('ALERT_REMIND_HOURS', '12')) * 3600,
+    checkpoint_seconds=float(os.getenv('ALERT_CHECKPOINT_SECONDS', '300'))
+)
 
-# Global variables for Bluetooth monitoring
-latest_readings = {}
-bluetooth_connected = False
+# Alerts are written and sent on worker threads; ALERT_DIGEST_WINDOW_SECONDS batches
+# a user's alerts into one digest, which only matters once users can have several plants
+alert_dispatcher = AlertDispatcher(
+    lambda user_id, entries: send_alert(user_id, entries),
+    window_seconds=float(os.getenv('ALERT_DIGEST_WINDOW_SECONDS', '0'))
+)
 
-async def find_arduino():
-    """Scan for and find the Arduino device"""
-    devices = await BleakScanner.discover()
-    for d in devices:
-        if d.name and "Plant" in d.name:
-            return d.address
-    return None
+# Latest state of every plant as versioned copy-on-write snapshots
+plant_states = PlantStateStore()
+plant_states.subscribe(
+    lambda user_id, snapshot: threshold_matrix.set(user_id, snapshot.data.get('thresholds') if snapshot else None)
+)
+plant_file_lock = threading.Lock()
+# Modification time of each plant file when its snapshot was loaded or written;
+# a different one means another worker process changed the file
+plant_file_mtimes = {}
+
+# Plants ordered by when their next sensor update is due
+monitor_scheduler = DueScheduler()
+MAX_SCHEDULER_SLEEP = 3600
+
+# Parsed Plant.id results keyed by image content, so re-sent photos are not re-uploaded
+plantid_cache = PlantIdCache(
+    os.path.join(USER_DATA_FOLDER, 'plantid_cache'),
+    # A diagnosis describes the plant when the photo was taken; species do not change
+    max_age={'health_assessment': float(os.getenv('HEALTH_CACHE_DAYS', '7')) * 24 * 3600}
+)
 
-async def notification_handler(sender, data):
-    """Handle incoming notifications from the device"""
-    try:
-        # Get current timestamp for logging
-        timestamp = time.strftime('%H:%M:%S')
+# Store user states; SESSION_STORE=sqlite:///path shares them between worker processes
+# (photos of abandoned registrations are left to the image store's retention)
+user_states = create_session_store(
+    os.getenv('SESSION_STORE', 'memory'),
+    ttl_seconds=int(os.getenv('SESSION_TTL_SECONDS', '1800'))
+)
+
+# Background workers for Plant.id/Groq image processing
+image_jobs = JobQueue(
+    'image',
+    workers=int(os.getenv('IMAGE_WORKERS', '4')),
+    max_pending=int(os.getenv('IMAGE_QUEUE_SIZE', '50'))
+)
+image_jobs.start()
+
+# Pushed messages are queued on disk and sent by a rate-limited worker pool;
+# replies stay synchronous because reply tokens expire within a minute
+line_dispatcher = LineDispatcher(
+    line_bot_api,
+    os.path.join(USER_DATA_FOLDER, 'line_outbox.sqlite3'),
+    workers=int(os.getenv('LINE_SEND_WORKERS', '4')),
+    rate_limits={
+        'line_push': float(os.getenv('LINE_PUSH_RATE', '2000')),
+        'line_multicast': float(os.getenv('LINE_MULTICAST_RATE', '200')),
+    }
+)
+line_dispatcher.start()
 
-        # Log raw data for debugging
-        logger.debug(f"Raw data received at {timestamp}: {data.hex()}")
+# Seconds to wait for an LLM reply before sending the template version instead
+LLM_REPLY_DEADLINE = float(os.getenv('LLM_REPLY_DEADLINE_SECONDS', '8'))
+LLM_ALERT_DEADLINE = float(os.getenv('LLM_ALERT_DEADLINE_SECONDS', '15'))
+# Push the LLM reply as a follow-up when it arrives after the template was sent
+LLM_FOLLOW_UP = os.getenv('LLM_FOLLOW_UP', 'false').lower() in ('1', 'true', 'yes')
 
-        # Unpack the data - using little endian format ('<') for 32-bit float
-        try:
-            value = struct.unpack('<f', data)[0]
-        except struct.error:
-            logger.error(f"Error unpacking data: {data.hex()}")
-            return
+# Registration fetches the health assessment, thresholds and description in parallel
+registration_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('REGISTRATION_WORKERS', '8')), thread_name_prefix='registration'
+)
+REGISTRATION_TIMEOUT = float(os.getenv('REGISTRATION_TIMEOUT_SECONDS', '25'))
 
-        char_uuid = sender.uuid.lower()
+# Immediate replies for images that are processed in the background
+IMAGE_ACK_MESSAGES = {
+    'awaiting_registration_image': "Lovely photo! 📸 Let me figure out what plant this is, I'll message you in a moment 🔍",
+    'awaiting_identification_image': "Got it! Let me take a close look, I'll message you in a moment 🔍🌱",
+    'awaiting_assessment_image': "Thank you! I'm checking your plant's health now, I'll message you in a moment 🏥🌿",
+}
 
-        # Round the value to 1 decimal place for consistency
-        value = round(value, 1)
+# Bluetooth characteristics UUIDs
+TEMP_CHARACTERISTIC_UUID = "00002a6e-0000-1000-8000-00805f9b34fb"
+HUMIDITY_CHARACTERISTIC_UUID = "00002a6f-0000-1000-8000-00805f9b34fb"
+SOIL_MOISTURE_CHARACTERISTIC_UUID = "00002a70-0000-1000-8000-00805f9b34fb"
 
-        if char_uuid == TEMP_CHARACTERISTIC_UUID.lower():
-            latest_readings['temperature'] = value
-            logger.debug(f"Temperature: {value}°C")
-        elif char_uuid == HUMIDITY_CHARACTERISTIC_UUID.lower():
-            latest_readings['humidity'] = value
-            logger.debug(f"Humidity: {value}%")
-        elif char_uuid == SOIL_MOISTURE_CHARACTERISTIC_UUID.lower():
-            latest_readings['moisture'] = value
-            logger.debug(f"Soil Moisture: {value}%")
+# BLE hub holding one session per sensor, each bound to a user's plant
+ble_hub = BleHub(
+    os.path.join(USER_DATA_FOLDER, 'device_bindings.json'),
+    {
+        TEMP_CHARACTERISTIC_UUID: 'temperature',
+        HUMIDITY_CHARACTERISTIC_UUID: 'humidity',
+        SOIL_MOISTURE_CHARACTERISTIC_UUID: 'moisture'
+    }
+)
 
-        logger.debug(f"Current readings: {latest_readings}")
+# Spans of each webhook event are appended to a JSON lines file (TRACE_SAMPLE_RATE=0 turns tracing off)
+tracing.configure(
+    os.getenv('TRACE_FILE', os.path.join(USER_DATA_FOLDER, 'traces.jsonl')),
+    sample_rate=float(os.getenv('TRACE_SAMPLE_RATE', '1.0'))
+)
 
-    except Exception as e:
-        logger.error(f"Error processing notification: {str(e)}")
-        logger.error(f"Data that caused error: {data.hex() if data else 'No data'}")
-        logger.error(f"Characteristic UUID: {sender.uuid}")
+# Sampling profiler, toggled at runtime with `kill -USR2 <pid>`; stopping it writes
+# collapsed stacks to user_data/profiles
+profiler = SamplingProfiler(interval=float(os.getenv('PROFILER_INTERVAL_MS', '5')) / 1000)
+try:
+    install_toggle(profiler, os.path.join(USER_DATA_FOLDER, 'profiles'))
+except ValueError:
+    logger.warning("Profiler toggle not installed: the app was not imported from the main thread")
+
+# Metrics served on /metrics; queue depths and sensor counts are read at scrape time
+webhook_seconds = metrics.histogram('plantita_webhook_seconds', "Webhook request handling time", ('outcome',))
+storage_seconds = metrics.histogram(
+    'plantita_storage_seconds', "Plant file and reading log I/O time", ('operation',), buckets=metrics.FAST_BUCKETS
+)
+tick_seconds = metrics.histogram('plantita_monitor_tick_seconds', "Time to update all plants due in a tick")
+scheduler_lag_seconds = metrics.histogram(
+    'plantita_scheduler_lag_seconds', "Delay between a plant falling due and the tick starting"
+)
+metrics.counter_callback(
+    'plantita_ble_notifications', "BLE notifications received per characteristic",
+    lambda: {(metric,): count for metric, count in ble_hub.notification_counts.items()},
+    ('characteristic',)
+)
+metrics.gauge_callback('plantita_ble_connected_sensors', "Connected BLE sensors", lambda: len(ble_hub.connected))
+metrics.gauge_callback('plantita_image_queue_depth', "Image jobs waiting for a worker", lambda: image_jobs.depth)
+metrics.gauge_callback('plantita_line_outbox_depth', "LINE messages waiting to be sent", lambda: line_dispatcher.depth)
+metrics.gauge_callback('plantita_scheduled_plants', "Plants in the monitoring schedule", lambda: len(monitor_scheduler))
+metrics.gauge_callback('plantita_alert_digests_pending', "Users with an alert digest waiting", lambda: alert_dispatcher.pending)
 
+@tracing.traced()
 def get_thresholds_from_llm(plant_name):
     """Get plant care thresholds from LLM based on scientific name"""
     try:
-        client = Groq(api_key=os.getenv('GROQ_API_KEY'))
+        cacheable = plant_name != UNKNOWN_PLANT
+        thresholds = threshold_cache.get(plant_name) if cacheable else None
+        if thresholds:
+            logger.info(f"Using cached thresholds for {plant_name}")
+            return thresholds
 
         prompt = (
             f"As a plant expert, provide the ideal growing conditions for {plant_name} in this exact format:\n"
@@ -118,267 +261,373 @@ def get_thresholds_from_llm(plant_name):
             f"Only respond with tab-separated values in Celsius for temperature, percentage for others. No explanations."
         )
 
-        response = client.chat.completions.create(
-            messages=[{"role": "user", "content": prompt}],
-            model="llama3-8b-8192"
-        )
-
-        values = response.choices[0].message.content.strip().split('\t')
-        return {
-            'temperature': {'min': float(values[0]), 'max': float(values[1])},
-            'humidity': {'min': float(values[2]), 'max': float(values[3])},
-            'moisture': {'min': float(values[6]), 'max': float(values[7])}
-        }
+        thresholds = parse_thresholds(chat_completion(prompt), THRESHOLD_METRICS)
+        if cacheable:
+            threshold_cache.set(plant_name, thresholds)
+        return thresholds
     except Exception as e:
         logger.error(f"Error getting thresholds from LLM: {str(e)}")
         return None
 
-async def start_monitoring():
-    """Start the monitoring process"""
-    global bluetooth_connected
-    while True:
+def get_monitoring_interval(plant_data):
+    """Seconds between updates of a plant (monitoring_frequency is in minutes)"""
+    return plant_data.get('monitoring_frequency', 60) * 60  # default to hourly if not set
+
+def get_plant_state(user_id):
+    """Get the state snapshot of a user's plant, loading it from disk on first use.
+
+    The snapshot is reloaded when the file was changed since, e.g. by
+    another worker process sharing USER_DATA_FOLDER. The check holds
+    plant_file_lock, so a write of this process that is still in flight
+    never gets the older file reloaded over its newer snapshot.
+    """
+    file_path = os.path.join(USER_DATA_FOLDER, f'plant_data_{user_id}.json')
+    with plant_file_lock:
+        snapshot = plant_states.get(user_id)
         try:
-            if not bluetooth_connected:
-                logger.info("Scanning for Arduino Plant Monitor...")
-                arduino_address = await find_arduino()
-                if not arduino_address:
-                    logger.error("Arduino not found")
-                    await asyncio.sleep(10)  # Shorter retry interval for initial connection
-                    continue
-
-                logger.info(f"Attempting to connect to Arduino at {arduino_address}")
-                async with BleakClient(arduino_address, timeout=20) as client:
-                    try:
-                        # Check if connection is successful
-                        if not client.is_connected:
-                            logger.error("Failed to connect")
-                            continue
-
-                        bluetooth_connected = True
-                        logger.info("Successfully connected to Arduino")
-
-                        # Get device info
-                        services = await client.get_services()
-                        logger.info("Services discovered:")
-                        for service in services:
-                            logger.info(f"Service: {service.uuid}")
-                            for char in service.characteristics:
-                                logger.info(f"  Characteristic: {char.uuid}")
-                                logger.info(f"  Properties: {char.properties}")
-
-                        # Enable notifications
-                        characteristics = [
-                            TEMP_CHARACTERISTIC_UUID,
-                            HUMIDITY_CHARACTERISTIC_UUID,
-                            SOIL_MOISTURE_CHARACTERISTIC_UUID
-                        ]
-
-                        for uuid in characteristics:
-                            try:
-                                await client.start_notify(uuid, notification_handler)
-                                logger.info(f"Enabled notifications for {uuid}")
-                            except Exception as e:
-                                logger.error(f"Failed to enable notifications for {uuid}: {e}")
-
-                        logger.info("All notifications enabled, entering monitoring loop")
-
-                        # Monitoring loop
-                        while bluetooth_connected and client.is_connected:
-                            await asyncio.sleep(60)  # Wait for 1 minute
-                            update_all_plant_data()
-                            logger.debug(f"Current readings: {latest_readings}")
-
-                    except BleakDBusError as e:
-                        logger.error(f"Bluetooth communication error: {e}")
-                        bluetooth_connected = False
-                    except Exception as e:
-                        logger.error(f"Unexpected error during monitoring: {e}")
-                        bluetooth_connected = False
-
+            mtime = os.stat(file_path).st_mtime_ns
+        except FileNotFoundError:
+            return snapshot
+        if snapshot is not None and plant_file_mtimes.get(user_id) == mtime:
+            return snapshot
+
+        with storage_seconds.labels('plant_file_read').time():
+            with open(file_path, 'r') as f:
+                data = json.load(f)
+        plant_file_mtimes[user_id] = mtime
+
+        # Legacy files keep their history inline; move it to the reading log once
+        migrated = 'reading_history' in data
+        if migrated:
+            reading_store.import_history(user_id, data.pop('reading_history'))
+        snapshot = plant_states.put(user_id, data)
+
+    if migrated:
+        write_plant_file(user_id)
+    return snapshot
+
+def load_registry():
+    """Load every registered plant into the state store and the scheduler"""
+    for user_file in Path(USER_DATA_FOLDER).glob('plant_data_*.json'):
+        user_id = user_file.stem.split('_')[2]
+        try:
+            data = get_plant_state(user_id).data
+            catch_up_rollups(user_id)
+            last_check = datetime.fromisoformat(data.get('last_check_time', '2000-01-01T00:00:00'))
+            interval = get_monitoring_interval(data)
+            monitor_scheduler.schedule(user_id, interval, next_due=last_check.timestamp() + interval)
         except Exception as e:
-            logger.error(f"Connection error: {e}")
-            bluetooth_connected = False
-            await asyncio.sleep(30)  # Wait before retrying connection
+            logger.error(f"Error loading {user_file}: {str(e)}")
+    logger.info(f"Scheduled {len(monitor_scheduler)} plants for monitoring")
+
+def catch_up_rollups(user_id):
+    """Fold readings logged since the newest rolled-up one into the rollups"""
+    rollup_store.add_many((user_id, reading) for reading in reading_store.read_range(user_id, start=rollup_store.latest_ts(user_id)))
 
-        finally:
-            bluetooth_connected = False
-            logger.info("Connection lost or monitoring stopped, will retry...")
+async def start_monitoring():
+    """Start the monitoring process"""
+    load_registry()
+
+    # Wake up early when a newly registered plant is due before the next one
+    loop = asyncio.get_running_loop()
+    wakeup = asyncio.Event()
+    monitor_scheduler.on_change = lambda: loop.call_soon_threadsafe(wakeup.set)
+
+    # Sensors connect and reconnect on their own tasks inside the hub
+    hub_task = asyncio.create_task(ble_hub.run())
+    while not hub_task.done():
+        wakeup.clear()
+        delay = monitor_scheduler.seconds_until_due()
+        timeout = MAX_SCHEDULER_SLEEP if delay is None else min(delay, MAX_SCHEDULER_SLEEP)
+        due_at = time.time() + timeout
+        try:
+            await asyncio.wait_for(wakeup.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+        due = monitor_scheduler.pop_due()
+        if due:
+            # Woken early by a change, the plants were due no earlier than now
+            scheduler_lag_seconds.observe(max(0.0, time.time() - due_at))
+            # File I/O and alerts run off the event loop so BLE sessions keep flowing
+            await asyncio.to_thread(update_all_plant_data, due)
+    logger.error(f"BLE hub stopped: {hub_task.exception()}")
 
 def start_monitoring_thread():
     """Start the monitoring loop in a background thread"""
     asyncio.run(start_monitoring())
 
-def update_all_plant_data():
-    """Update data for all registered plants"""
+def update_all_plant_data(user_ids=None, ts=None):
+    """Update data for the given plants (all registered plants by default).
+
+    ts stamps the tick's readings (now by default); replays pass their
+    virtual clock so dwell and cooldown follow it.
+    """
+    with tick_seconds.time():
+        _update_all_plant_data(user_ids, ts)
+
+def _update_all_plant_data(user_ids, ts):
     try:
-        for user_file in Path(USER_DATA_FOLDER).glob('plant_data_*.json'):
-            user_id = user_file.stem.split('_')[2]
-            update_plant_data(user_id)
+        if user_ids is None:
+            user_ids = [f.stem.split('_')[2] for f in Path(USER_DATA_FOLDER).glob('plant_data_*.json')]
+
+        # One emit per sensor, even when several plants fall back to the same one
+        stats = ble_hub.interval_stats_for_users(user_ids)
+        updated = {}
+        for user_id in user_ids:
+            result = update_plant_data(user_id, stats.get(user_id), ts)
+            if result:
+                updated[user_id] = result
+
+        # Every reading of the tick goes into the rollups in one transaction
+        try:
+            with storage_seconds.labels('rollup_update').time():
+                rollup_store.add_many((user_id, reading) for user_id, (reading, _) in updated.items())
+        except Exception as e:
+            logger.error(f"Error updating rollups: {str(e)}")
+
+        # One vectorized threshold pass over every plant updated this tick
+        breaches = threshold_matrix.evaluate({user_id: reading for user_id, (reading, _) in updated.items()})
+        breaches_by_user = {}
+        for user_id, metric, condition in breaches:
+            breaches_by_user.setdefault(user_id, []).append((metric, condition))
+
+        for user_id, (reading, plant_data) in updated.items():
+            user_breaches = breaches_by_user.get(user_id, [])
+            forecasts = get_new_forecasts(
+                user_id, plant_data, {metric for metric, _ in user_breaches} | alert_states.active_metrics(user_id)
+            )
+            # Plants with open alert states need every reading to leave them
+            if user_breaches or forecasts or user_id in alert_states:
+                check_thresholds(user_id, reading, user_breaches, plant_data, forecasts)
+        alert_states.checkpoint()
     except Exception as e:
         logger.error(f"Error updating plant data: {str(e)}")
 
-def update_plant_data(user_id):
-    """Update plant data with new sensor readings"""
+def get_new_forecasts(user_id, plant_data, breached):
+    """Predicted breaches the user has not been warned about yet.
+
+    A warning is forgotten once the trend heads away from the range
+    boundary or its ETA moves past FORECAST_FORGET_HORIZON, so the same
+    metric drifting out of range again later warns again, but an ETA
+    wobbling around the horizon does not.
+    """
+    forecasts = [
+        forecast for forecast in trend_tracker.forecast(user_id, plant_data.get('thresholds'), FORECAST_FORGET_HORIZON)
+        if forecast[0] not in breached
+    ]
+    warned = forecast_warnings.get(user_id)
+    if warned:
+        warned.intersection_update((metric, condition) for metric, condition, _ in forecasts)
+    return [
+        forecast for forecast in forecasts
+        if forecast[2] <= FORECAST_HORIZON and not (warned and forecast[:2] in warned)
+    ]
+
+def warm_trends(user_id, history):
+    """Seed a plant's trends from its in-memory history, once after startup"""
+    latest = history.latest()
+    start = latest['ts'] - 4 * trend_tracker.half_life if latest else None
+    timestamps, values = history.window(start=start)
+    for i, ts in enumerate(timestamps):
+        trend_tracker.update(user_id, {'ts': float(ts), **{metric: float(v[i]) for metric, v in values.items()}})
+
+def get_reading_history(user_id, frequency_minutes=60):
+    """Get the in-memory reading history of a user, loading it on first use"""
+    history = reading_histories.get(user_id)
+    if history is None:
+        history = ReadingHistory.for_frequency(frequency_minutes)
+        history.extend(reading_store.read_range(user_id, start=time.time() - history.retention_seconds))
+        reading_histories[user_id] = history
+    return history
+
+def update_plant_data(user_id, stats=None, ts=None):
+    """Update plant data with new sensor readings.
+
+    stats are the plant's sensor stats for the interval, read from the
+    BLE hub when not given, and ts the reading's epoch time (now by
+    default). Returns (reading, plant_data) when a new reading was
+    recorded, else None.
+    """
     try:
-        file_path = os.path.join(USER_DATA_FOLDER, f'plant_data_{user_id}.json')
-        if not os.path.exists(file_path):
-            return
-
-        with open(file_path, 'r+') as f:
-            data = json.load(f)
-
-            # Check if it's time to update based on frequency
-            last_check = datetime.fromisoformat(data.get('last_check_time', '2000-01-01T00:00:00'))
-            frequency_minutes = data.get('monitoring_frequency', 60)  # default to hourly if not set
-            if datetime.now() - last_check < timedelta(minutes=frequency_minutes):
-                return  # Skip update if not enough time has passed
-
-            # Initialize history if not present
-            if 'reading_history' not in data:
-                data['reading_history'] = []
-
-            # Add timestamp to current reading
-            current_reading = latest_readings.copy()
-            current_reading['timestamp'] = datetime.now().isoformat()
-
-            # Add new reading
-            data['reading_history'].append(current_reading)
-
-            # Remove readings older than 1 week
-            week_ago = datetime.now() - timedelta(days=7)
-            data['reading_history'] = [
-                reading for reading in data['reading_history']
-                if datetime.fromisoformat(reading['timestamp']) > week_ago
-            ]
+        snapshot = get_plant_state(user_id)
+        if snapshot is None:
+            return None
 
-            # Update latest reading and check time
-            data['latest_reading'] = current_reading
-            data['last_check_time'] = datetime.now().isoformat()
+        # The scheduler only calls this when the plant is due
+        frequency_minutes = snapshot.data.get('monitoring_frequency', 60)  # default to hourly if not set
+
+        # Summarize every sample since the last update, not just the last one
+        if stats is None:
+            stats = ble_hub.interval_stats_for_user(user_id)
+        if not stats:
+            return None  # No sensor data for this plant since the last update
+
+        readings = {metric: round(s['mean'], 1) for metric, s in stats.items()}
+        readings['stats'] = stats
+
+        # Dwell time of a first bad reading counts from the reading before it,
+        # which the alert states only see for plants they are already tracking
+        previous_ts = (snapshot.data.get('latest_reading') or {}).get('ts')
+        if previous_ts is None and snapshot.data.get('last_check_time'):
+            previous_ts = datetime.fromisoformat(snapshot.data['last_check_time']).timestamp()
+        if previous_ts is not None:
+            alert_states.seen(user_id, previous_ts)
+
+        # Append the new reading to the log instead of rewriting the history
+        with storage_seconds.labels('reading_append').time():
+            current_reading = reading_store.append(user_id, readings, ts=ts)
+        history = get_reading_history(user_id, frequency_minutes)
+        history.append(current_reading['ts'], current_reading)
+
+        # Trends take each reading once; only the first update after startup reads the history
+        if user_id in trend_tracker:
+            trend_tracker.update(user_id, current_reading)
+        else:
+            warm_trends(user_id, history)
 
-            # Reset file pointer and write updated data
-            f.seek(0)
-            json.dump(data, f, indent=4)
-            f.truncate()
+        # Update latest reading and check time (metadata only)
+        snapshot = save_plant_state(
+            user_id,
+            latest_reading=current_reading,
+            last_check_time=datetime.fromtimestamp(current_reading['ts']).isoformat()
+        )
 
-            # Check thresholds and send notification if needed
-            check_thresholds(user_id, current_reading, data['thresholds'], data.get('nickname', 'your plant'))
+        # Thresholds are checked for all plants at once by the caller
+        return current_reading, snapshot.data
 
     except Exception as e:
         logger.error(f"Error updating plant data: {str(e)}")
+        return None
 
-def check_thresholds(user_id, reading, thresholds, plant_nickname=None):
-    """Check if readings are outside thresholds and notify user"""
-    try:
-        alerts = []
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        file_path = os.path.join(USER_DATA_FOLDER, f'plant_data_{user_id}.json')
-
-        with open(file_path, 'r') as f:
-            plant_data = json.load(f)
+def check_thresholds(user_id, reading, breaches, plant_data, forecasts=()):
+    """Notify user about (metric, 'low' | 'high') threshold breaches.
 
-        # Get monitoring frequency and nickname
-        monitoring_frequency = plant_data.get('monitoring_frequency', 60)  # default to hourly
+    Breaches go through the alert state machine, which decides whether
+    they alert now. forecasts are (metric, 'low' | 'high', seconds)
+    breaches predicted by the trends, sent in the same digest as warnings
+    ahead of time.
+    """
+    try:
+        # Get nickname and thresholds
         plant_nickname = plant_data.get('nickname', 'your plant')
+        thresholds = plant_data['thresholds']
 
-        for metric, value in reading.items():
-            if metric == 'timestamp':  # Skip timestamp field
-                continue
-
-            if metric in thresholds and isinstance(value, (int, float)):
-                threshold = thresholds[metric]
-                if value < threshold['min']:
-                    alerts.append({
-                        'metric': metric,
-                        'value': value,
-                        'threshold': threshold['min'],
-                        'condition': 'low'
-                    })
-                elif value > threshold['max']:
-                    alerts.append({
-                        'metric': metric,
-                        'value': value,
-                        'threshold': threshold['max'],
-                        'condition': 'high'
-                    })
+        fired = alert_states.observe(user_id, reading['ts'], reading, breaches, thresholds)
+
+        alerts = []
+        for metric, condition in sorted(fired, key=lambda b: THRESHOLD_METRICS.index(b[0])):
+            alerts.append({
+                'metric': metric,
+                'value': reading[metric],
+                'threshold': thresholds[metric]['min' if condition == 'low' else 'max'],
+                'condition': condition
+            })
+        for metric, condition, seconds in forecasts:
+            alerts.append({
+                'metric': metric,
+                'value': reading.get(metric),
+                'threshold': thresholds[metric]['min' if condition == 'low' else 'max'],
+                'condition': condition,
+                'eta_seconds': seconds
+            })
 
         if alerts:
-            # Check if we should send an alert based on monitoring frequency
-            last_alert_time = plant_data.get('last_alert_time')
-            if last_alert_time:
-                last_alert = datetime.fromisoformat(last_alert_time)
-                min_time_between_alerts = timedelta(minutes=monitoring_frequency)
-                if datetime.now() - last_alert < min_time_between_alerts:
-                    logger.info(f"Skipping alert for {user_id}, not enough time elapsed since last alert")
-                    return
-
-            # Update last alert time
-            plant_data['last_alert_time'] = timestamp
-            with open(file_path, 'w') as f:
-                json.dump(plant_data, f, indent=4)
-
-            send_alert(user_id, alerts, reading, thresholds, plant_nickname)
+            forecast_warnings.setdefault(user_id, set()).update((metric, condition) for metric, condition, _ in forecasts)
+
+            alert_dispatcher.add(user_id, user_id, {
+                'plant_nickname': plant_nickname,
+                'alerts': alerts,
+                'reading': reading,
+                'thresholds': thresholds
+            })
 
     except Exception as e:
         logger.error(f"Error checking thresholds: {str(e)}")
 
-def send_alert(user_id, alerts, reading, thresholds, plant_nickname):
-    """Send alert message using LLM for natural language"""
-    try:
-        client = Groq(api_key=os.getenv('GROQ_API_KEY'))
+def llm_reply(prompt, fallback, deadline, user_id=None):
+    """Ask the LLM for a reply, returning fallback() if it is late or fails.
 
-        # Format alerts for better prompt
-        alert_details = []
-        for alert in alerts:
-            metric_name = alert['metric'].replace('_', ' ').title()
-            condition = 'too low' if alert['condition'] == 'low' else 'too high'
-            ideal = f"ideal: {alert['threshold']}"
-            alert_details.append(f"{metric_name} is {condition} ({alert['value']}, {ideal})")
+    With LLM_FOLLOW_UP enabled and a user_id given, a reply that arrives
+    after the deadline is pushed to the user as a follow-up message.
+    """
+    on_late_reply = None
+    if LLM_FOLLOW_UP and user_id is not None:
+        on_late_reply = lambda text: push_text(user_id, text)
 
-        alert_text = "\n".join(alert_details)
+    try:
+        return chat_completion(prompt, deadline=deadline, on_late_reply=on_late_reply)
+    except DeadlineExceeded:
+        logger.warning(f"LLM missed its {deadline}s deadline, sending template reply")
+    except Exception as e:
+        logger.error(f"LLM reply failed, sending template reply: {str(e)}")
+    return fallback()
+
+def send_alert(user_id, entries):
+    """Send one alert digest for all of a user's plants using LLM for natural language"""
+    try:
+        # Format alerts for better prompt, grouped by plant
+        plant_sections = []
+        for entry in entries:
+            alert_details = []
+            for alert in entry['alerts']:
+                metric_name = alert['metric'].replace('_', ' ').title()
+                condition = 'too low' if alert['condition'] == 'low' else 'too high'
+                ideal = f"ideal: {alert['threshold']}"
+                if 'eta_seconds' in alert:
+                    eta = fallback_messages.format_eta(alert['eta_seconds'])
+                    alert_details.append(f"{metric_name} will be {condition} in {eta} ({alert['value']} now, {ideal})")
+                else:
+                    alert_details.append(f"{metric_name} is {condition} ({alert['value']}, {ideal})")
+            plant_sections.append(f"{entry['plant_nickname']}:\n" + "\n".join(alert_details))
+
+        alert_text = "\n\n".join(plant_sections)
+        nicknames = [entry['plant_nickname'] for entry in entries]
+        plant_names = nicknames[0] if len(nicknames) == 1 else ", ".join(nicknames[:-1]) + f" and {nicknames[-1]}"
 
         prompt = (
-            f"You are Plantita, a caring plant expert and concerned aunt figure. Your beloved {plant_nickname} "
-            f"has some concerning readings that need attention:\n\n"
+            f"You are Plantita, a caring plant expert and concerned aunt figure. Your beloved {plant_names} "
+            f"{'has' if len(nicknames) == 1 else 'have'} some concerning readings that need attention:\n\n"
             f"{alert_text}\n\n"
-            f"Create a caring but urgent notification message that:\n"
+            f"Create a single caring but urgent notification message that:\n"
             f"1. Expresses concern about the specific issues\n"
             f"2. Explains the potential risks to the plant\n"
             f"3. Provides immediate actions they can take\n"
-            f"4. Offers reassurance and support\n\n"
+            f"4. Offers reassurance and support\n"
+            f"For readings that will only be out of range later, say when to act (for example 'water in ~6 hours').\n\n"
             f"Keep the tone warm and caring but emphasize the importance of addressing these issues soon. "
             f"Make it personal, like an aunt worried about her favorite plant."
         )
 
-        response = client.chat.completions.create(
-            messages=[{"role": "user", "content": prompt}],
-            model="llama3-8b-8192"
+        # Alerts never get a follow-up; a second push for the same readings would be noise
+        alert_message = llm_reply(
+            prompt,
+            lambda: fallback_messages.render_alert(entries),
+            LLM_ALERT_DEADLINE
         )
 
-        alert_message = response.choices[0].message.content
-
         # Log the alert
-        logger.info(f"Sending alert to {user_id} for {plant_nickname}")
+        logger.info(f"Sending alert to {user_id} for {plant_names}")
         logger.debug(f"Alert message: {alert_message}")
 
         # Send the message
-        line_bot_api.push_message_with_http_info(
-            {
-                'to': user_id,
-                'messages': [TextMessage(text=alert_message)]
-            }
-        )
+        push_text(user_id, alert_message)
 
     except Exception as e:
         logger.error(f"Error sending alert: {str(e)}")
 
+@tracing.traced()
 def identify_plant(image_path):
     """Identify plant from image using Plant.id API"""
     try:
-        url = "https://api.plant.id/v2/identify"
+        cache_key, plant_name = plantid_cache.get('identify', image_path)
+        if plant_name is not None:
+            return plant_name
+
+        url = f"{PLANTID_API_URL}/identify"
         api_key = os.getenv('PLANTID_API_KEY')
 
-        with open(image_path, "rb") as image_file:
-            base64_image = base64.b64encode(image_file.read()).decode("utf-8")
+        base64_image = image_preprocessor.get_payload(image_path)
 
         headers = {
             "Content-Type": "application/json",
@@ -392,28 +641,34 @@ def identify_plant(image_path):
             "include-plant-details": ["common_names", "url", "wiki_description"]
         }
 
-        response = requests.post(url, headers=headers, json=data)
-        response.raise_for_status()
+        response = post_json('plantid_identify', url, headers=headers, json=data)
 
         results = response.json()
         if results.get("suggestions"):
             best_match = max(results["suggestions"], key=lambda x: x["probability"])
-            return best_match["plant_name"]
+            plant_name = best_match["plant_name"]
+        else:
+            plant_name = UNKNOWN_PLANT
 
-        return "Unknown Plant"
+        plantid_cache.set('identify', image_path, plant_name, key=cache_key)
+        return plant_name
 
     except Exception as e:
         logger.error(f"Error in plant identification: {str(e)}")
-        return "Unknown Plant"
+        return UNKNOWN_PLANT
 
+@tracing.traced()
 def get_health_assessment(image_path):
     """Get plant health assessment using Plant.id API"""
     try:
-        url = "https://api.plant.id/v2/health_assessment"
+        cache_key, health_data = plantid_cache.get('health_assessment', image_path)
+        if health_data is not None:
+            return health_data
+
+        url = f"{PLANTID_API_URL}/health_assessment"
         api_key = os.getenv('PLANTID_API_KEY')
 
-        with open(image_path, "rb") as image_file:
-            base64_image = base64.b64encode(image_file.read()).decode("utf-8")
+        base64_image = image_preprocessor.get_payload(image_path)
 
         headers = {
             "Content-Type": "application/json",
@@ -427,16 +682,17 @@ def get_health_assessment(image_path):
             "details": ["watering", "best_watering", "best_light_condition", "best_soil_type"]
         }
 
-        response = requests.post(url, headers=headers, json=data)
-        response.raise_for_status()
+        response = post_json('plantid_health', url, headers=headers, json=data)
 
         if response.status_code == 200:
             results = response.json()
-            return {
+            health_data = {
                 'health_info': results.get('health_assessment', {}),
                 'is_healthy': results.get('is_healthy', True),
                 'diseases': results.get('diseases', [])
             }
+            plantid_cache.set('health_assessment', image_path, health_data, key=cache_key)
+            return health_data
         else:
             logger.error(f"Error response from Plant.id API: {response.text}")
             return {"status": "error", "message": "Could not assess plant health"}
@@ -445,11 +701,10 @@ def get_health_assessment(image_path):
         logger.error(f"Error in health assessment: {str(e)}")
         return {"status": "error", "message": "Could not assess plant health"}
 
-def get_plant_description(plant_name, nickname, plant_details):
+@tracing.traced()
+def get_plant_description(plant_name, nickname, plant_details, user_id=None):
     """Get a natural description of the plant using Groq with care instructions"""
     try:
-        client = Groq(api_key=os.getenv('GROQ_API_KEY'))
-
         watering_info = plant_details.get('best_watering', 'Regular watering when soil feels dry')
         light_info = plant_details.get('best_light_condition', 'Moderate indirect light')
         soil_info = plant_details.get('best_soil_type', 'Well-draining potting mix')
@@ -469,53 +724,47 @@ def get_plant_description(plant_name, nickname, plant_details):
             f"Include both scientific facts and practical care advice."
         )
 
-        response = client.chat.completions.create(
-            messages=[{"role": "user", "content": prompt}],
-            model="llama3-8b-8192"
+        return llm_reply(
+            prompt,
+            lambda: fallback_messages.render_description(plant_name, nickname, plant_details),
+            LLM_REPLY_DEADLINE,
+            user_id=user_id
         )
 
-        return response.choices[0].message.content
-
     except Exception as e:
         logger.error(f"Error getting plant description: {str(e)}")
         return f"Your beloved {nickname}, a beautiful {plant_name}"
 
-def save_image(message_content, user_id):
-    """Save image from LINE to local storage"""
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    filename = f'plant_{user_id}_{timestamp}.jpg'
-    file_path = os.path.join(UPLOAD_FOLDER, filename)
-
-    with open(file_path, 'wb') as f:
-        f.write(message_content)
+@tracing.traced()
+def save_image(message_id):
+    """Stream an image from LINE straight into the image store"""
+    url = f"{LINE_DATA_API_URL}/v2/bot/message/{message_id}/content"
+    headers = {"Authorization": f"Bearer {os.getenv('CHANNEL_ACCESS_TOKEN')}"}
 
-    logger.info(f"Image saved: {file_path}")
-    return file_path
+    with get_stream('line_content', url, headers=headers) as response:
+        return image_store.save_stream(response.iter_content(chunk_size=64 * 1024))
 
-def get_current_readings():
-    """Get current readings from plant monitor"""
+def get_current_readings(user_id):
+    """Get current readings from the sensor bound to a user's plant"""
     try:
-        if not latest_readings:
-            return None
-        return latest_readings.copy()
+        return ble_hub.readings_for_user(user_id)
     except Exception as e:
         logger.error(f"Error reading sensor data: {str(e)}")
         return None
 
+@tracing.traced()
 def get_plant_status_message(user_id, readings):
     """Get natural language status update for plant"""
     try:
-        file_path = os.path.join(USER_DATA_FOLDER, f'plant_data_{user_id}.json')
-        if not os.path.exists(file_path):
+        snapshot = get_plant_state(user_id)
+        if snapshot is None:
             return "I don't have any registered plants for you yet! Would you like to register one? Just type 'register' to get started! 🌱"
 
-        with open(file_path, 'r') as f:
-            data = json.load(f)
+        data = snapshot.data
 
         if 'latest_reading' not in data:
             return "No readings available yet!"
 
-        client = Groq(api_key=os.getenv('GROQ_API_KEY'))
         prompt = (
             f"You are Plantita, a caring plant expert. Create a friendly status update for {data['nickname']} ({data['scientific_name']}):\n"
             f"Current readings: {data['latest_reading']}\n"
@@ -523,24 +772,92 @@ def get_plant_status_message(user_id, readings):
             f"Include both the current status and any care suggestions if needed."
         )
 
-        response = client.chat.completions.create(
-            messages=[{"role": "user", "content": prompt}],
-            model="llama3-8b-8192"
+        return llm_reply(
+            prompt,
+            lambda: fallback_messages.render_status(
+                data['nickname'], data['scientific_name'], data['latest_reading'], data['thresholds']
+            ),
+            LLM_REPLY_DEADLINE,
+            user_id=user_id
         )
 
-        return response.choices[0].message.content
-
     except Exception as e:
         logger.error(f"Error getting status: {str(e)}")
         return "Sorry, I'm having trouble checking your plant right now!"
 
-def save_user_plant_data(user_id, plant_data):
-    """Save user's plant data to JSON file"""
+@tracing.traced()
+def get_week_summary_message(user_id, days=7):
+    """Summarize the last days of readings from the rollups"""
+    try:
+        snapshot = get_plant_state(user_id)
+        if snapshot is None:
+            return "I don't have any registered plants for you yet! Would you like to register one? Just type 'register' to get started! 🌱"
+
+        data = snapshot.data
+        now = time.time()
+        summary = rollup_store.summary(user_id, now - days * DAY, now)
+        return fallback_messages.render_week(data['nickname'], summary, data.get('thresholds'), days)
+
+    except Exception as e:
+        logger.error(f"Error getting week summary: {str(e)}")
+        return "Sorry, I'm having trouble looking back at your plant's week right now!"
+
+@tracing.traced()
+def write_plant_file(user_id):
+    """Write the newest state snapshot of a user's plant to its JSON file"""
     filename = f'plant_data_{user_id}.json'
     file_path = os.path.join(USER_DATA_FOLDER, filename)
 
-    with open(file_path, 'w') as f:
-        json.dump(plant_data, f, indent=4)
+    with plant_file_lock, storage_seconds.labels('plant_file_write').time():
+        # Other workers may read the file at any time, so never show them half of it
+        tmp_path = f'{file_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(plant_states.get(user_id).to_dict(), f, indent=4)
+        os.replace(tmp_path, file_path)
+        plant_file_mtimes[user_id] = os.stat(file_path).st_mtime_ns
+    return file_path
+
+def save_plant_state(user_id, **changes):
+    """Update some fields of a user's plant state and persist it"""
+    snapshot = plant_states.update(user_id, **changes)
+    write_plant_file(user_id)
+    return snapshot
+
+@tracing.traced()
+def complete_registration(user_id, plant_name, nickname, image_path):
+    """Fetch thresholds and the care guide of a new plant, saving each as it arrives.
+
+    Thresholds do not depend on the health assessment, so they are fetched
+    alongside it; the description starts as soon as the assessment is in.
+    Returns the description, or a template one if it is not ready in time.
+    """
+    graph = TaskGraph(registration_executor)
+    graph.add('health', get_health_assessment, image_path)
+    graph.add(
+        'thresholds', get_thresholds_from_llm, plant_name,
+        on_done=lambda thresholds: save_plant_state(user_id, thresholds=thresholds)
+    )
+    graph.add(
+        'description',
+        lambda health_data: get_plant_description(
+            plant_name, nickname, health_data.get('health_info', {}), user_id=user_id
+        ),
+        after=('health',),
+        on_done=lambda description: save_plant_state(user_id, description=description)
+    )
+
+    results = graph.wait(timeout=REGISTRATION_TIMEOUT)
+    description = results.get('description')
+    if description is None:
+        health_data = results.get('health', {})
+        description = fallback_messages.render_description(plant_name, nickname, health_data.get('health_info', {}))
+    return description
+
+@tracing.traced()
+def save_user_plant_data(user_id, plant_data):
+    """Save user's plant data to JSON file"""
+    plant_states.put(user_id, plant_data)
+    file_path = write_plant_file(user_id)
 
     logger.info(f"Plant data saved: {file_path}")
 
@@ -549,23 +866,32 @@ def home():
     logger.info("Home endpoint accessed")
     return "Plantita Bot is Running!"
 
+@app.route("/metrics")
+def get_metrics():
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route("/webhook", methods=['POST'])
 def webhook():
     logger.info("Webhook endpoint accessed")
+    start = time.perf_counter()
+    outcome = 'ok'
 
     try:
-        logger.debug("Request Headers:")
-        for header, value in request.headers.items():
-            logger.debug(f"{header}: {value}")
+        # Headers and bodies hold user messages; only log them when debugging
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Request Headers:")
+            for header, value in request.headers.items():
+                logger.debug(f"{header}: {value}")
 
         signature = request.headers.get('X-Line-Signature', '')
-        logger.info(f"Signature: {signature}")
+        logger.debug(f"Signature: {signature}")
 
         body = request.get_data(as_text=True)
-        logger.info(f"Request body: {body}")
+        logger.debug(f"Request body: {body}")
 
         if body == '{}' or body == '' or (isinstance(body, str) and json.loads(body).get('events', []) == []):
             logger.info("Verification request detected")
+            outcome = 'verification'
             return 'OK'
 
         handler.handle(body, signature)
@@ -574,45 +900,55 @@ def webhook():
 
     except InvalidSignatureError as e:
         logger.error(f"Invalid signature error: {str(e)}")
+        outcome = 'invalid_signature'
         abort(400)
     except Exception as e:
         logger.error(f"Unexpected error in webhook: {str(e)}", exc_info=True)
+        outcome = 'error'
         return 'OK'
+    finally:
+        webhook_seconds.labels(outcome).observe(time.perf_counter() - start)
+
+def push_text(user_id, text):
+    """Queue a text message to a user outside of a reply"""
+    line_dispatcher.push(user_id, text)
+
+def send_reply(reply_token, text):
+    """Reply to a webhook event with a text message"""
+    observed_call('line_reply', lambda: line_bot_api.reply_message_with_http_info(
+        {
+            'replyToken': reply_token,
+            'messages': [TextMessage(text=text)]
+        }
+    ))
 
-@handler.add(MessageEvent, message=ImageMessageContent)
-def handle_image_message(event):
-    """Handle image messages from users"""
+def process_image_message(user_id, message_id, user_state):
+    """Download and analyse an image in the background, then push the result"""
     try:
-        logger.info(f"Handling image message from user: {event.source.user_id}")
-        user_id = event.source.user_id
-        message_content = blob_api.get_message_content(message_id=event.message.id)
-        image_path = save_image(message_content, user_id)
-
-        # Check user state
-        user_state = user_states.get(user_id, {}).get('state')
-        logger.info(f"User state for {user_id}: {user_state}")
+        image_path = save_image(message_id)
+        # Start shrinking the photo right away; Plant.id calls pick up the cached payload
+        image_preprocessor.submit(image_path)
 
         if user_state == 'awaiting_registration_image':
             # Process registration image
             plant_name = identify_plant(image_path)
-            user_states[user_id] = {
+            user_states.set(user_id, {
                 'state': 'awaiting_nickname',
                 'plant_name': plant_name,
                 'image_path': image_path
-            }
+            })
             reply_text = f"I've identified your plant as {plant_name}! What nickname would you like to give it?"
 
         elif user_state == 'awaiting_identification_image':
             # Process identification request
             plant_name = identify_plant(image_path)
             reply_text = f"This appears to be {plant_name}! Would you like to register this plant? Just type 'register' if you do! 🌿"
-            user_states[user_id] = {'state': 'idle'}
+            user_states.set(user_id, {'state': 'idle'})
 
-        elif user_state == 'awaiting_assessment_image':
+        else:
             # Process health assessment using Groq
             health_data = get_health_assessment(image_path)
-            plant_name = user_states.get(user_id, {}).get('plant_name', 'your plant')
-            client = Groq(api_key=os.getenv('GROQ_API_KEY'))
+            plant_name = user_states.get(user_id).get('plant_name', 'your plant')
 
             # Create detailed health assessment prompt
             prompt = (
@@ -628,13 +964,44 @@ def handle_image_message(event):
                 f"Keep your tone warm and encouraging, like a knowledgeable aunt giving plant advice."
             )
 
-            response = client.chat.completions.create(
-                messages=[{"role": "user", "content": prompt}],
-                model="llama3-8b-8192"
+            reply_text = llm_reply(
+                prompt,
+                lambda: fallback_messages.render_health_assessment(plant_name, health_data),
+                LLM_REPLY_DEADLINE,
+                user_id=user_id
             )
+            user_states.set(user_id, {'state': 'idle'})
 
-            reply_text = response.choices[0].message.content
-            user_states[user_id] = {'state': 'idle'}
+        push_text(user_id, reply_text)
+        logger.info(f"Image result pushed to {user_id}")
+
+    except Exception as e:
+        logger.error(f"Error processing image: {str(e)}", exc_info=True)
+        push_text(user_id, "Sorry, I had trouble processing your image. Please try again later.")
+
+@handler.add(MessageEvent, message=ImageMessageContent)
+@tracing.traced_event('image_message')
+def handle_image_message(event):
+    """Handle image messages from users"""
+    try:
+        logger.info(f"Handling image message from user: {event.source.user_id}")
+        user_id = event.source.user_id
+
+        # Check user state
+        user_state = user_states.get(user_id).get('state')
+        logger.info(f"User state for {user_id}: {user_state}")
+
+        if user_state in IMAGE_ACK_MESSAGES:
+            # Plant.id and Groq run in the background; the result is pushed later
+            try:
+                job_id = image_jobs.submit(
+                    tracing.continue_trace(process_image_message), user_id, event.message.id, user_state
+                )
+                logger.info(f"Queued image job {job_id} for {user_id}")
+                reply_text = IMAGE_ACK_MESSAGES[user_state]
+            except queue.Full:
+                logger.warning(f"Image queue full, rejecting image from {user_id}")
+                reply_text = "I'm looking at a lot of plants right now! 🌿 Please send your photo again in a minute."
 
         else:
             reply_text = "Thanks for sharing your plant photo! 🌿 Would you like me to:\n\n" \
@@ -642,49 +1009,38 @@ def handle_image_message(event):
                          "2. Identify it (say 'Hi Plantita, please help me identify this plant!')\n" \
                          "3. Check its health (say 'Hello Plantita, can you help me assess this plant?')"
 
-        line_bot_api.reply_message_with_http_info(
-            {
-                'replyToken': event.reply_token,
-                'messages': [TextMessage(text=reply_text)]
-            }
-        )
+        send_reply(event.reply_token, reply_text)
         logger.info("Reply sent successfully")
 
     except Exception as e:
         logger.error(f"Error handling image: {str(e)}", exc_info=True)
-        line_bot_api.reply_message_with_http_info(
-            {
-                'replyToken': event.reply_token,
-                'messages': [TextMessage(text="Sorry, I had trouble processing your image. Please try again later.")]
-            }
-        )
+        send_reply(event.reply_token, "Sorry, I had trouble processing your image. Please try again later.")
 
 @handler.add(MessageEvent, message=TextMessageContent)
+@tracing.traced_event('text_message')
 def handle_text_message(event):
     """Handle text messages from users"""
     try:
         logger.info(f"Handling text message from user: {event.source.user_id}")
         user_id = event.source.user_id
         text = event.message.text.lower()
+        session = user_states.get(user_id)
 
         if text == 'register':
-            user_states[user_id] = {'state': 'awaiting_registration_image'}
+            user_states.set(user_id, {'state': 'awaiting_registration_image'})
             reply = "Please send me a clear photo of your plant so I can register it! 📸🌿"
 
         elif text.startswith("hi plantita, please help me identify"):
-            user_states[user_id] = {'state': 'awaiting_identification_image'}
+            user_states.set(user_id, {'state': 'awaiting_identification_image'})
             reply = "Of course! Please send me a clear photo of the plant you'd like to identify 🔍🌱"
 
         elif text.startswith("hello plantita, can you help me assess"):
-            user_states[user_id] = {'state': 'awaiting_assessment_image'}
+            user_states.set(user_id, {'state': 'awaiting_assessment_image'})
             reply = "I'll be happy to check your plant's health! Please send me a clear photo 🏥🌿"
 
-        elif user_states.get(user_id, {}).get('state') == 'awaiting_nickname':
+        elif session.get('state') == 'awaiting_nickname':
             nickname = text.strip()
-            user_states[user_id].update({
-                'nickname': nickname,
-                'state': 'awaiting_frequency'
-            })
+            user_states.update(user_id, nickname=nickname, state='awaiting_frequency')
             reply = (
                 f"Great nickname! 🌱 Now, how often would you like me to check on {nickname}? Please choose:\n\n"
                 "1️⃣ Every minute (type '1')\n"
@@ -692,7 +1048,7 @@ def handle_text_message(event):
                 "3️⃣ Every 8 hours (type '3')"
             )
 
-        elif user_states.get(user_id, {}).get('state') == 'awaiting_frequency':
+        elif session.get('state') == 'awaiting_frequency':
             frequency_map = {
                 '1': {'minutes': 1, 'description': 'minute'},
                 '2': {'minutes': 60, 'description': 'hour'},
@@ -708,53 +1064,61 @@ def handle_text_message(event):
                 )
             else:
                 frequency = frequency_map[text]
-                plant_name = user_states[user_id]['plant_name']
-                nickname = user_states[user_id]['nickname']
-                image_path = user_states[user_id]['image_path']
-
-                # Get plant health data from PlantID
-                health_data = get_health_assessment(image_path)
-
-                # Get thresholds from LLM if not provided by PlantID
-                thresholds = get_thresholds_from_llm(plant_name)
-                plant_details = health_data.get('health_info', {})
-                description = get_plant_description(plant_name, nickname, plant_details)
+                plant_name = session['plant_name']
+                nickname = session['nickname']
+                image_path = session['image_path']
 
+                # Save the plant right away; thresholds and description are filled in as they arrive
                 plant_data = {
                     'scientific_name': plant_name,
                     'nickname': nickname,
-                    'thresholds': thresholds,
-                    'description': description,
-                    'reading_history': [],
+                    'thresholds': None,
+                    'description': None,
                     'monitoring_frequency': frequency['minutes'],
-                    'last_check_time': datetime.now().isoformat(),
-                    'last_alert_time': None
+                    'last_check_time': datetime.now().isoformat()
                 }
                 save_user_plant_data(user_id, plant_data)
+                monitor_scheduler.schedule(user_id, get_monitoring_interval(plant_data))
+                description = complete_registration(user_id, plant_name, nickname, image_path)
                 reply = (
                     f"Perfect! I've registered your {plant_name} with the nickname '{nickname}'. 🌱✨\n\n"
                     f"I'll check on {nickname} every {frequency['description']} and let you know if anything needs attention!\n\n"
                     f"{description}\n\n"
                     "You can now monitor its health and get care advice!"
                 )
-                user_states[user_id] = {'state': 'idle'}
+                user_states.set(user_id, {'state': 'idle'})
+
+        elif text == 'sensors':
+            devices = ble_hub.unbound_devices()
+            if devices:
+                reply = "I can see these unlinked sensors 📡:\n\n" + "\n".join(devices) + \
+                        "\n\nType 'link sensor <address>' to connect one to your plant!"
+            else:
+                reply = "I can't see any unlinked sensors right now 📡 Make sure yours is switched on and nearby!"
+
+        elif text.startswith('link sensor '):
+            address = text[len('link sensor '):].strip().upper()
+            if get_plant_state(user_id) is None:
+                reply = "Please register your plant first (type 'register') so I know where this sensor lives! 🌱"
+            else:
+                ble_hub.bind(address, user_id)
+                reply = f"Sensor {address} is now linked to your plant! 📡🌿"
 
         elif text.startswith("hi plantita, can you check on my plant"):
-            readings = get_current_readings()
+            readings = get_current_readings(user_id)
             reply = get_plant_status_message(user_id, readings)
 
+        elif text.startswith("show me this week"):
+            reply = get_week_summary_message(user_id)
+
         else:
             reply = "Hello! 👋 I'm Plantita Bot. I can help you:\n\n" \
                     "1. Register your plant (type 'register')\n" \
                     "2. Identify plants (say 'Hi Plantita, please help me identify this plant!')\n" \
-                    "3. Assess plant health (say 'Hello Plantita, can you help me assess this plant?')"
+                    "3. Assess plant health (say 'Hello Plantita, can you help me assess this plant?')\n" \
+                    "4. See your plant's week (say 'Show me this week')"
 
-        line_bot_api.reply_message_with_http_info(
-            {
-                'replyToken': event.reply_token,
-                'messages': [TextMessage(text=reply)]
-            }
-        )
+        send_reply(event.reply_token, reply)
         logger.info("Reply sent successfully")
 
     except Exception as e:
@@ -0,0 +1,74 @@
+"""Stand-ins for bleak's BleakClient and BleakScanner.
+
+FakeBleakClient connects instantly and, once notifications are started,
+streams little-endian float samples for every subscribed characteristic
+like the Arduino sensor does, then reports a disconnect.
+"""
+import asyncio
+import random
+import struct
+from types import SimpleNamespace
+
+FLOAT_VALUE = struct.Struct('<f')
+
+# Typical values and noise per characteristic UUID prefix
+SAMPLE_RANGES = {
+    '00002a6e': (23.0, 2.0),   # temperature
+    '00002a6f': (55.0, 5.0),   # humidity
+    '00002a70': (45.0, 8.0),   # soil moisture
+}
+
+
+class FakeBleakScanner:
+    """Discovers the devices listed in FakeBleakScanner.devices"""
+
+    devices = []
+
+    @classmethod
+    async def discover(cls, *args, **kwargs):
+        return [SimpleNamespace(name=name, address=address) for address, name in cls.devices]
+
+
+class FakeBleakClient:
+    """Async context manager with the subset of BleakClient the hub uses.
+
+    Each connection sends `samples` rounds of notifications, one per
+    characteristic, yielding to the event loop every `batch` rounds, and
+    then calls the disconnected callback. Finished sessions are counted
+    in FakeBleakClient.completed.
+    """
+
+    samples = 1000
+    batch = 50
+    completed = 0
+
+    def __init__(self, address, timeout=None, disconnected_callback=None, **kwargs):
+        self.address = address
+        self.disconnected_callback = disconnected_callback
+        self._handlers = {}
+        self._task = None
+
+    async def __aenter__(self):
+        self._task = asyncio.ensure_future(self._stream())
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def start_notify(self, uuid, callback):
+        self._handlers[uuid] = (SimpleNamespace(uuid=uuid), callback)
+
+    async def _stream(self):
+        # Let the session finish subscribing before the first sample
+        await asyncio.sleep(0)
+        rng = random.Random(self.address)
+        pack = FLOAT_VALUE.pack
+        for i in range(self.samples):
+            for uuid, (sender, callback) in self._handlers.items():
+                mean, spread = SAMPLE_RANGES.get(uuid[:8], (50.0, 5.0))
+                callback(sender, pack(rng.gauss(mean, spread)))
+            if i % self.batch == self.batch - 1:
+                await asyncio.sleep(0)
+        FakeBleakClient.completed += 1
+        if self.disconnected_callback:
+            self.disconnected_callback(self)
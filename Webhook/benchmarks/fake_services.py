@@ -0,0 +1,197 @@
+"""In-process stand-ins for the LINE Messaging API, Groq and Plant.id.
+
+Each fake is a small threaded HTTP server on localhost that answers the
+endpoints the bot uses with canned payloads after a configurable delay,
+so benchmarks exercise the real HTTP clients without touching the
+network.
+"""
+import io
+import json
+import random
+import re
+import socket
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import numpy as np
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+class FakeService:
+    """Threaded HTTP server answering (method, path regex) routes.
+
+    A route function receives (match, body) and returns (status,
+    content_type, payload bytes). Every response is delayed by latency
+    seconds plus up to jitter seconds.
+    """
+
+    def __init__(self, name, routes, latency=0.0, jitter=0.0):
+        self.name = name
+        self.routes = [(method, re.compile(pattern), func) for method, pattern, func in routes]
+        self.latency = latency
+        self.jitter = jitter
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name=f'fake-{self.name}', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _respond(self, method, path, body):
+        with self._lock:
+            self.requests += 1
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            time.sleep(delay)
+        for route_method, pattern, func in self.routes:
+            match = pattern.fullmatch(path)
+            if route_method == method and match:
+                return func(match, body)
+        return 404, 'application/json', b'{"message": "Not found"}'
+
+    def _make_handler(self):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                # Without this, delayed ACKs add ~40 ms to every keep-alive request
+                self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def _handle(self, method):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                status, content_type, payload = service._respond(method, self.path.split('?')[0], body)
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                self._handle('GET')
+
+            def do_POST(self):
+                self._handle('POST')
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def _json(status, value):
+    return status, 'application/json', json.dumps(value).encode()
+
+
+def make_photo(seed, size=(1280, 960)):
+    """JPEG of a reproducible noise pattern, different for every seed"""
+    if Image is None:
+        return random.Random(seed).randbytes(256 * 1024)
+    rng = np.random.default_rng(zlib.crc32(str(seed).encode()))
+    # Coarse blocks keep perceptual hashes of different seeds far apart
+    blocks = rng.integers(0, 256, (size[1] // 64, size[0] // 64, 3), dtype=np.uint8)
+    pixels = np.kron(blocks, np.ones((64, 64, 1), dtype=np.uint8))
+    pixels = pixels + rng.integers(0, 24, pixels.shape, dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, 'JPEG', quality=92)
+    return buffer.getvalue()
+
+
+def fake_line(latency=0.0, jitter=0.0):
+    """Messaging API (reply, push, multicast) and content API on one server"""
+    service = None
+
+    def send(match, body):
+        with service._lock:
+            service.messages.append((match.group(1), json.loads(body or b'{}')))
+        return _json(200, {'sentMessages': [{'id': '1', 'quoteToken': 'q'}]})
+
+    def content(match, body):
+        return 200, 'image/jpeg', make_photo(match.group(1))
+
+    service = FakeService('line', [
+        ('POST', r'/v2/bot/message/(reply|push|multicast)', send),
+        ('GET', r'/v2/bot/message/([^/]+)/content', content),
+    ], latency, jitter)
+    service.messages = []
+    return service
+
+
+GROQ_THRESHOLDS_REPLY = "18\t27\t40\t70\t30\t60"
+GROQ_TEXT_REPLY = (
+    "Oh, my dear! Your plant is doing wonderfully 🌿 Keep the soil lightly moist, "
+    "give it bright indirect light and let me know if anything changes. 💚"
+)
+
+
+def fake_groq(latency=0.0, jitter=0.0):
+    """OpenAI-compatible chat completions as served by Groq"""
+
+    def completions(match, body):
+        request = json.loads(body)
+        prompt = request['messages'][-1]['content']
+        content = GROQ_THRESHOLDS_REPLY if 'tab-separated' in prompt else GROQ_TEXT_REPLY
+        return _json(200, {
+            'id': 'chatcmpl-fake',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': request.get('model', 'fake'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop'
+            }],
+            'usage': {'prompt_tokens': len(prompt) // 4, 'completion_tokens': len(content) // 4,
+                      'total_tokens': (len(prompt) + len(content)) // 4}
+        })
+
+    return FakeService('groq', [
+        ('POST', r'/openai/v1/chat/completions', completions),
+    ], latency, jitter)
+
+
+def fake_plantid(latency=0.0, jitter=0.0):
+    """Plant.id v2 identification and health assessment"""
+
+    def identify(match, body):
+        return _json(200, {'suggestions': [
+            {'plant_name': 'Monstera deliciosa', 'probability': 0.93},
+            {'plant_name': 'Philodendron bipinnatifidum', 'probability': 0.04},
+        ]})
+
+    def health(match, body):
+        return _json(200, {
+            'is_healthy': True,
+            'diseases': [],
+            'health_assessment': {
+                'best_watering': 'Water when the top 5 cm of soil are dry',
+                'best_light_condition': 'Bright indirect light',
+                'best_soil_type': 'Chunky, well-draining aroid mix'
+            }
+        })
+
+    return FakeService('plantid', [
+        ('POST', r'/v2/identify', identify),
+        ('POST', r'/v2/health_assessment', health),
+    ], latency, jitter)
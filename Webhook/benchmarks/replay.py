@@ -0,0 +1,341 @@
+"""Replay sensor traces from thousands of virtual devices to load-test ingestion.
+
+Every virtual device is a registered plant with a bound sensor. Its
+samples come from a synthetic generator (diurnal temperature and
+humidity, soil that dries out until it is watered) or from a recorded
+trace, and are packed exactly like the Arduino sketch sends them: one
+little-endian float notification per characteristic, once per sample
+interval. Packets go through the BLE hub's notification handler. Due
+plants are updated through update_all_plant_data on a virtual clock,
+which also stamps their readings, so readings, threshold checks and
+alerts follow the same path and timing as in production.
+
+Virtual time runs --speedup times faster than wall time. When a step takes
+longer than its wall-time budget the driver falls behind. A run whose lag
+exceeds --max-lag of its wall duration is reported as saturated.
+
+    python benchmarks/replay.py --devices 1000 --hours 24 --sample-interval 60 --speedup 3600
+    python benchmarks/replay.py --trace user_data/readings/<user_id> --devices 200 --hours 6
+    python benchmarks/replay.py --ramp 250 500 1000 2000 4000 --hours 1 --sample-interval 10
+
+Recorded traces are CSV files with a 'timestamp' or 'ts' column, JSONL
+files, or folders of JSONL files such as a user's reading log in
+user_data/readings/<user_id>. Alert dwell, cooldown and reminders
+follow the virtual clock; the digest window of the alert dispatcher
+follows wall time, so it defaults to 0 here as in production.
+"""
+import argparse
+import bisect
+import csv
+import json
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+from fake_ble import FLOAT_VALUE
+from run_benchmarks import Environment, Sender, latency_stats, sensor_address
+from scheduler import DueScheduler
+
+# Pressure is sent by the sketch too, although the bot ignores it
+PRESSURE_CHARACTERISTIC_UUID = "00002a6d-0000-1000-8000-00805f9b34fb"
+TRACE_METRICS = ('temperature', 'humidity', 'moisture')
+
+
+class SyntheticSensor:
+    """Plant sensor following a daily cycle, with soil drying between waterings.
+
+    Temperature peaks mid-afternoon and humidity moves against it. Soil
+    moisture falls faster when it is warm, and the plant is watered back
+    to field capacity once it drops below water_at. A water_at below 0
+    is a neglected plant that is never watered.
+    """
+
+    def __init__(self, seed, mean_temperature=23.0, daily_swing=4.0, mean_humidity=55.0,
+                 drying_per_hour=0.6, water_at=25.0, field_capacity=80.0):
+        rng = random.Random(seed)
+        self.rng = rng
+        self.mean_temperature = mean_temperature + rng.uniform(-2, 2)
+        self.daily_swing = daily_swing * rng.uniform(0.5, 1.5)
+        self.mean_humidity = mean_humidity + rng.uniform(-10, 10)
+        self.drying_per_hour = drying_per_hour * rng.uniform(0.5, 2.0)
+        self.water_at = water_at
+        self.field_capacity = field_capacity
+        self.moisture = rng.uniform(water_at + 5, field_capacity)
+        self._last = None
+
+    def sample(self, t):
+        hour = (t % 86400) / 3600
+        # Coldest around 03:00, warmest around 15:00
+        cycle = -math.cos(2 * math.pi * (hour - 3) / 24)
+        temperature = self.mean_temperature + self.daily_swing * cycle + self.rng.gauss(0, 0.2)
+        humidity = self.mean_humidity - 2.5 * self.daily_swing * cycle + self.rng.gauss(0, 1.0)
+
+        if self._last is not None:
+            hours = (t - self._last) / 3600
+            warmth = max(0.2, 1 + (temperature - self.mean_temperature) / 10)
+            self.moisture -= self.drying_per_hour * warmth * hours
+        self._last = t
+        if self.moisture < self.water_at:
+            self.moisture = self.field_capacity
+        self.moisture = max(0.0, self.moisture)
+
+        return {
+            'temperature': temperature,
+            'humidity': min(100.0, max(0.0, humidity)),
+            'moisture': self.moisture + self.rng.gauss(0, 0.5),
+        }
+
+
+class RecordedTrace:
+    """Loop a recorded trace, holding each value until the next record.
+
+    Devices sharing a trace start at different offsets so they are not
+    in lockstep.
+    """
+
+    def __init__(self, records, offset=0.0):
+        records = sorted(records, key=lambda r: r['ts'])
+        if len(records) < 2:
+            raise ValueError("A trace needs at least two records")
+        self.times = [r['ts'] for r in records]
+        self.records = records
+        self.start = self.times[0]
+        self.duration = self.times[-1] - self.start or 1.0
+        self.offset = offset
+
+    def sample(self, t):
+        position = self.start + (t + self.offset) % self.duration
+        index = max(0, bisect.bisect_right(self.times, position) - 1)
+        record = self.records[index]
+        return {metric: record[metric] for metric in TRACE_METRICS if metric in record}
+
+
+def _record_from_row(row):
+    ts = row.get('ts')
+    if ts in (None, ''):
+        ts = datetime.fromisoformat(row['timestamp']).timestamp()
+    record = {'ts': float(ts)}
+    for metric in TRACE_METRICS:
+        if row.get(metric) not in (None, ''):
+            record[metric] = float(row[metric])
+    return record
+
+
+def load_trace(path):
+    """Read trace records ({'ts', metric: value}) from a CSV, JSONL or folder of JSONL"""
+    path = Path(path)
+    files = sorted(path.glob('*.jsonl')) if path.is_dir() else [path]
+    records = []
+    for file in files:
+        with open(file, 'r', newline='') as f:
+            if file.suffix == '.csv':
+                rows = csv.DictReader(f)
+            else:
+                rows = (json.loads(line) for line in f if line.strip())
+            for row in rows:
+                try:
+                    records.append(_record_from_row(row))
+                except (KeyError, ValueError):
+                    continue
+    return records
+
+
+class ReplayDriver:
+    """Drive one Environment with a set of virtual devices on a virtual clock"""
+
+    def __init__(self, env, sources, sample_interval=1.0, speedup=60.0, monitoring_minutes=1,
+                 prefix='replay-'):
+        self.env = env
+        self.app = env.app
+        self.sample_interval = sample_interval
+        self.speedup = speedup
+        self.monitoring_seconds = monitoring_minutes * 60
+
+        hub = self.app.ble_hub
+        uuid_by_metric = {metric: uuid for uuid, metric in hub.characteristics.items()}
+        self.user_ids = env.register_plants(prefix, len(sources), monitoring_frequency=monitoring_minutes)
+        self.devices = []
+        for user_id, source in zip(self.user_ids, sources):
+            handler = hub._make_handler(sensor_address(user_id))
+            self.devices.append((handler, source))
+        self.senders = [(metric, Sender(uuid)) for metric, uuid in uuid_by_metric.items()]
+        self.pressure = Sender(PRESSURE_CHARACTERISTIC_UUID)
+        self.alerts = 0
+
+    def run(self, virtual_seconds, start=None):
+        """Replay virtual_seconds of traffic; returns a dict of results"""
+        # Count this run's alerts only; the original add is back for the next driver
+        dispatcher = self.app.alert_dispatcher
+        dispatcher_add = dispatcher.add
+
+        def count_alert(*args):
+            self.alerts += 1
+            dispatcher_add(*args)
+
+        self.alerts = 0
+        dispatcher.add = count_alert
+        try:
+            return self._run(virtual_seconds, start)
+        finally:
+            dispatcher.add = dispatcher_add
+
+    def _run(self, virtual_seconds, start):
+        start = time.time() if start is None else start
+        scheduler = DueScheduler()
+        # Spread the first updates over one interval, as restarts and registrations do
+        for i, user_id in enumerate(self.user_ids):
+            offset = self.monitoring_seconds * (i + 1) / len(self.user_ids)
+            scheduler.schedule(user_id, self.monitoring_seconds, next_due=start + offset)
+
+        pack = FLOAT_VALUE.pack
+        pressure_packet = pack(101.3)
+        steps = int(virtual_seconds / self.sample_interval)
+        packets = 0
+        ingest_seconds = 0.0
+        tick_samples = []
+        updated = 0
+        max_lag = 0.0
+
+        wall_start = time.perf_counter()
+        for step in range(1, steps + 1):
+            now = start + step * self.sample_interval
+
+            ingest_start = time.perf_counter()
+            for handler, source in self.devices:
+                values = source.sample(now)
+                for metric, sender in self.senders:
+                    value = values.get(metric)
+                    if value is not None:
+                        handler(sender, pack(value))
+                        packets += 1
+                handler(self.pressure, pressure_packet)
+                packets += 1
+            ingest_seconds += time.perf_counter() - ingest_start
+
+            due = scheduler.pop_due(now=now)
+            if due:
+                tick_start = time.perf_counter()
+                self.app.update_all_plant_data(due, ts=now)
+                tick_samples.append(time.perf_counter() - tick_start)
+                updated += len(due)
+
+            # Stay on the virtual clock; a negative budget means we are behind
+            budget = wall_start + step * self.sample_interval / self.speedup - time.perf_counter()
+            if budget > 0:
+                time.sleep(budget)
+            else:
+                max_lag = max(max_lag, -budget)
+
+        wall_seconds = time.perf_counter() - wall_start
+        target_seconds = virtual_seconds / self.speedup
+        return {
+            'devices': len(self.devices),
+            'virtual_hours': round(virtual_seconds / 3600, 2),
+            'wall_seconds': round(wall_seconds, 2),
+            'packets': packets,
+            'packets_per_second': round(packets / wall_seconds, 1),
+            'target_packets_per_second': round(packets / target_seconds, 1),
+            'ingest_share': round(ingest_seconds / wall_seconds, 3),
+            'updates': updated,
+            **{f'tick_{k}': v for k, v in latency_stats(tick_samples).items()},
+            'tick_max_ms': round(max(tick_samples, default=0) * 1e3, 3),
+            'alerts': self.alerts,
+            'max_lag_seconds': round(max_lag, 3),
+            'lag_share': round(max(0.0, wall_seconds - target_seconds) / target_seconds, 3),
+            'storage_bytes': _folder_size(self.app.USER_DATA_FOLDER),
+        }
+
+
+def _folder_size(folder):
+    total = 0
+    for root, _, files in os.walk(folder):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                continue
+    return total
+
+
+def make_sources(args, count, seed_prefix=''):
+    if args.trace:
+        records = load_trace(args.trace)
+        rng = random.Random(args.seed)
+        duration = RecordedTrace(records).duration
+        return [RecordedTrace(records, offset=rng.uniform(0, duration)) for _ in range(count)]
+
+    sources = []
+    for i in range(count):
+        neglected = i < count * args.neglected
+        sources.append(SyntheticSensor(f'{args.seed}-{seed_prefix}{i}', water_at=-1.0 if neglected else 25.0))
+    return sources
+
+
+def print_results(results):
+    for key, value in results.items():
+        print(f"  {key:<28} {value:>14}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--devices', type=int, default=1000, help="virtual devices (one plant each)")
+    parser.add_argument('--ramp', type=int, nargs='+',
+                        help="device counts to try in order, stopping at the first saturated run")
+    parser.add_argument('--hours', type=float, default=24.0, help="virtual hours to replay")
+    parser.add_argument('--sample-interval', type=float, default=60.0,
+                        help="virtual seconds between notifications (the sketch sends every second)")
+    parser.add_argument('--speedup', type=float, default=3600.0, help="virtual seconds per wall second")
+    parser.add_argument('--monitoring-minutes', type=int, default=60, help="monitoring frequency of every plant")
+    parser.add_argument('--trace', help="recorded trace (CSV, JSONL or reading log folder) instead of synthetic data")
+    parser.add_argument('--neglected', type=float, default=0.1,
+                        help="share of synthetic plants that are never watered")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--max-lag', type=float, default=0.1,
+                        help="lag, as a share of the run's wall duration, that counts as saturated")
+    parser.add_argument('--alert-window', type=float, default=0.0, help="alert digest window in wall seconds")
+    parser.add_argument('--line-latency', type=float, default=0.01)
+    parser.add_argument('--groq-latency', type=float, default=0.2)
+    parser.add_argument('--plantid-latency', type=float, default=0.3)
+    parser.add_argument('--log-level', default='WARNING')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    env = Environment(args, alert_window=args.alert_window)
+    try:
+        counts = args.ramp or [args.devices]
+        for run, count in enumerate(counts):
+            print(f"Replaying {args.hours}h for {count} devices at {args.speedup:g}x...", flush=True)
+            driver = ReplayDriver(
+                env, make_sources(args, count, seed_prefix=f'{run}-'),
+                sample_interval=args.sample_interval,
+                speedup=args.speedup,
+                monitoring_minutes=args.monitoring_minutes,
+                prefix=f'replay{run}-'
+            )
+            pushes_before = len(env.line.messages)
+            results = driver.run(args.hours * 3600)
+            # Send digests still in their window, then wait for the alert and LINE workers;
+            # a fast replay raises alerts much faster than the LLM can word them
+            env.app.alert_dispatcher.flush_all()
+            env.app.alert_dispatcher.wait(timeout=600)
+            env.app.line_dispatcher.drain(timeout=60)
+            results['messages_sent'] = len(env.line.messages) - pushes_before
+            print_results(results)
+            if results['lag_share'] > args.max_lag:
+                print(f"Saturated at {count} devices")
+                return 1
+        if args.ramp:
+            print(f"No saturation up to {counts[-1]} devices")
+        return 0
+    finally:
+        env.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,488 @@
+"""Benchmarks for the Plantita webhook, monitoring tick and registration flow.
+
+LINE, Groq and Plant.id are replaced by local fake servers and bleak by a
+fake client, so the suite runs offline. Results are compared with
+baseline.json next to this file; any metric more than its tolerance
+worse than its baseline is reported as a regression and the exit code is
+1. The tolerance is --tolerance, widened for the benchmarks and metrics in
+TOLERANCES whose timings swing with the machine's load. With --repeat, every
+benchmark runs several times and the median of each metric counts.
+
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --only webhook_text update_tick
+    python benchmarks/run_benchmarks.py --groq-latency 2 --plantid-latency 1
+    python benchmarks/run_benchmarks.py --update-baseline --repeat 5
+
+Baselines depend on the machine; record new ones with --update-baseline
+and a few repeats when moving the suite to different hardware.
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCHMARK_DIR.parent))
+sys.path.insert(0, str(BENCHMARK_DIR))
+
+from fake_ble import FLOAT_VALUE, FakeBleakClient, FakeBleakScanner
+from fake_services import fake_groq, fake_line, fake_plantid
+
+BASELINE_PATH = BENCHMARK_DIR / 'baseline.json'
+CHANNEL_SECRET = 'benchmark-secret'
+THRESHOLDS = {
+    'temperature': {'min': 18.0, 'max': 27.0},
+    'humidity': {'min': 40.0, 'max': 70.0},
+    'moisture': {'min': 30.0, 'max': 60.0},
+}
+SAMPLE_VALUES = {'temperature': 23.0, 'humidity': 55.0, 'moisture': 45.0}
+
+# Allowed slowdown per benchmark or 'benchmark.metric', where wider than
+# --tolerance. Ticks are dominated by small file writes and SQLite commits,
+# whose medians swing by up to 3x between runs on a shared machine. Tails of
+# fast calls are mostly GC pauses and thread switches: 8 webhook senders on
+# a single core, or a check of a few microseconds.
+TOLERANCES = {
+    'update_tick': 2.0,
+    'webhook_status.p99_ms': 2.0,
+    'check_thresholds.p99_us': 4.0,
+    'webhook_text.p99_ms': 6.0,
+}
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def latency_stats(samples, unit='ms'):
+    scale = 1e3 if unit == 'ms' else 1e6
+    return {
+        f'p50_{unit}': round(percentile(samples, 50) * scale, 3),
+        f'p99_{unit}': round(percentile(samples, 99) * scale, 3),
+    }
+
+
+class Environment:
+    """Fake services plus the bot imported against them in a scratch directory"""
+
+    def __init__(self, args, alert_window=3600):
+        self.line = fake_line(args.line_latency).start()
+        self.groq = fake_groq(args.groq_latency).start()
+        self.plantid = fake_plantid(args.plantid_latency).start()
+
+        self.workdir = tempfile.mkdtemp(prefix='plantita-bench-')
+        os.chdir(self.workdir)
+        os.environ.update({
+            'CHANNEL_ACCESS_TOKEN': 'benchmark-token',
+            'CHANNEL_SECRET': CHANNEL_SECRET,
+            'GROQ_API_KEY': 'benchmark-key',
+            'PLANTID_API_KEY': 'benchmark-key',
+            'LINE_API_URL': self.line.url,
+            'LINE_DATA_API_URL': self.line.url,
+            'GROQ_BASE_URL': self.groq.url,
+            'PLANTID_API_URL': f'{self.plantid.url}/v2',
+            # By default digests are held so they are not sent in the middle of later benchmarks
+            'ALERT_DIGEST_WINDOW_SECONDS': str(alert_window),
+        })
+
+        import ble_hub
+        ble_hub.BleakClient = FakeBleakClient
+        ble_hub.BleakScanner = FakeBleakScanner
+
+        import app
+        logging.getLogger().setLevel(args.log_level)
+        self.app = app
+        self.client = app.app.test_client()
+        self._handlers = {}
+        self._next_message = 0
+        self._lock = threading.Lock()
+
+    def close(self):
+        # Deliver held digests while the fakes are still up
+        self.app.alert_dispatcher.flush_all()
+        self.app.alert_dispatcher.wait(timeout=60)
+        self.app.line_dispatcher.drain(timeout=30)
+        for service in (self.line, self.groq, self.plantid):
+            service.stop()
+        os.chdir(BENCHMARK_DIR)
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def _message_id(self):
+        with self._lock:
+            self._next_message += 1
+            return str(self._next_message)
+
+    def event_body(self, user_id, text=None, image=False):
+        message_id = self._message_id()
+        if image:
+            message = {'type': 'image', 'id': message_id, 'quoteToken': 'q',
+                       'contentProvider': {'type': 'line'}}
+        else:
+            message = {'type': 'text', 'id': message_id, 'quoteToken': 'q', 'text': text}
+        return json.dumps({
+            'destination': 'benchmark',
+            'events': [{
+                'type': 'message',
+                'mode': 'active',
+                'timestamp': int(time.time() * 1000),
+                'webhookEventId': f'event-{message_id}',
+                'deliveryContext': {'isRedelivery': False},
+                'source': {'type': 'user', 'userId': user_id},
+                'replyToken': f'reply-{message_id}',
+                'message': message,
+            }]
+        })
+
+    def post_event(self, body, client=None):
+        signature = base64.b64encode(
+            hmac.new(CHANNEL_SECRET.encode(), body.encode(), hashlib.sha256).digest()
+        ).decode()
+        response = (client or self.client).post(
+            '/webhook', data=body, content_type='application/json',
+            headers={'X-Line-Signature': signature}
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"Webhook returned {response.status_code}")
+
+    def feed_samples(self, user_ids, rounds=10, offsets=None):
+        """Push sensor samples for every user's device through the BLE notification handler"""
+        hub = self.app.ble_hub
+        for user_id in user_ids:
+            address = sensor_address(user_id)
+            handler = self._handlers.get(address)
+            if handler is None:
+                handler = self._handlers[address] = hub._make_handler(address)
+            offset = (offsets or {}).get(user_id, 0.0)
+            for i in range(rounds):
+                for uuid, metric in hub.characteristics.items():
+                    handler(Sender(uuid), FLOAT_VALUE.pack(SAMPLE_VALUES[metric] + offset + (i % 3)))
+
+    def register_plants(self, prefix, count, monitoring_frequency=60):
+        """Register count plants with a bound sensor each, without going through chat"""
+        app = self.app
+        user_ids = [f'{prefix}{i}' for i in range(count)]
+        for user_id in user_ids:
+            app.save_user_plant_data(user_id, {
+                'scientific_name': 'Monstera deliciosa',
+                'nickname': f'plant {user_id}',
+                'thresholds': THRESHOLDS,
+                'description': 'benchmark plant',
+                'monitoring_frequency': monitoring_frequency,
+                'last_check_time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'last_alert_time': None
+            })
+        app.ble_hub.bindings.update({sensor_address(user_id): user_id for user_id in user_ids})
+        app.ble_hub._save_bindings()
+        return user_ids
+
+
+def sensor_address(user_id):
+    return f'BENCH-{user_id}'.upper()
+
+
+class Sender:
+    """Characteristic as passed to notification handlers"""
+
+    __slots__ = ('uuid',)
+
+    def __init__(self, uuid):
+        self.uuid = uuid
+
+
+def bench_webhook(env, user_ids, text, events, concurrency):
+    """Signed text events through /webhook, including the LINE reply"""
+    bodies = [env.event_body(user_ids[i % len(user_ids)], text) for i in range(events)]
+    samples = []
+
+    def worker(chunk):
+        client = env.app.app.test_client()
+        local = []
+        for body in chunk:
+            start = time.perf_counter()
+            env.post_event(body, client)
+            local.append(time.perf_counter() - start)
+        return local
+
+    chunks = [bodies[i::concurrency] for i in range(concurrency)]
+    with ThreadPoolExecutor(concurrency) as pool:
+        # One untimed event per sender opens the connections to the fakes
+        warmup = [[env.event_body(user_ids[i % len(user_ids)], text)] for i in range(concurrency)]
+        list(pool.map(worker, warmup))
+
+        start = time.perf_counter()
+        for local in pool.map(worker, chunks):
+            samples.extend(local)
+    elapsed = time.perf_counter() - start
+    return {'events_per_second': round(events / elapsed, 1), **latency_stats(samples)}
+
+
+def bench_webhook_text(env, args):
+    return bench_webhook(env, ['text-user'], 'hello', args.events, args.concurrency)
+
+
+def bench_webhook_status(env, args):
+    user_ids = env.register_plants('status', args.concurrency)
+    env.feed_samples(user_ids)
+    env.app.update_all_plant_data(user_ids)
+    return bench_webhook(env, user_ids, 'hi plantita, can you check on my plant?',
+                         max(args.concurrency, args.events // 5), args.concurrency)
+
+
+def bench_update_tick(env, args):
+    """Cost of one monitoring tick as the number of due plants grows"""
+    results = {}
+    for count in args.tick_sizes:
+        user_ids = env.register_plants(f'tick{count}-', count)
+        # Every tenth plant is too dry, so the threshold and alert path runs too
+        offsets = {user_id: -30.0 for user_id in user_ids[::10]}
+        samples = []
+        # Small ticks are over in milliseconds; take enough of them for a stable median
+        for _ in range(max(args.ticks, 200 // count)):
+            env.feed_samples(user_ids, offsets=offsets)
+            start = time.perf_counter()
+            env.app.update_all_plant_data(user_ids)
+            samples.append(time.perf_counter() - start)
+        results[f'users_{count}_p50_ms'] = round(percentile(samples, 50) * 1e3, 3)
+        results[f'users_{count}_per_user_us'] = round(percentile(samples, 50) / count * 1e6, 1)
+    return results
+
+
+def bench_check_thresholds(env, args):
+    """A plant hovering at its thresholds through check_thresholds (alert states and digest queueing)"""
+    app = env.app
+    user_id = env.register_plants('breach', 1)[0]
+    env.feed_samples([user_id], offsets={user_id: -30.0})
+    reading, plant_data = app.update_plant_data(user_id)
+    breaches = [('moisture', 'low'), ('humidity', 'low')]
+
+    samples = []
+    for i in range(args.events):
+        # A reading a minute, out of range every other one
+        noisy = dict(reading, ts=reading['ts'] + 60 * i)
+        start = time.perf_counter()
+        app.check_thresholds(user_id, noisy, breaches if i % 2 == 0 else [], plant_data)
+        samples.append(time.perf_counter() - start)
+    # The rate follows the median call; a few slow calls would dominate a mean
+    return {'calls_per_second': round(1 / percentile(samples, 50), 1), **latency_stats(samples, 'us')}
+
+
+def bench_alert_dwell(env, args):
+    """A plant going dry after a calm stretch, on a virtual clock; fails if it alerts before the dwell time"""
+    app = env.app
+    # A new plant every run; a repeat must not inherit the last run's dry readings
+    user_id = env.register_plants(f'dwell{time.time_ns()}-', 1, monitoring_frequency=1)[0]
+    alerts = []
+    dispatcher_add = app.alert_dispatcher.add
+
+    def count_alert(alert_user_id, plant_id, entry):
+        if alert_user_id == user_id:
+            alerts.append(now)
+        dispatcher_add(alert_user_id, plant_id, entry)
+
+    app.alert_dispatcher.add = count_alert
+    try:
+        now = time.time()
+        # Half an hour in range, then too dry from one reading on
+        for minute in range(30):
+            now += 60
+            env.feed_samples([user_id])
+            app.update_all_plant_data([user_id], ts=now)
+        if alerts:
+            raise RuntimeError(f"{user_id} alerted while in range")
+        # Dwell counts from the last reading that was in range
+        last_in_range = now
+        while not alerts and now < last_in_range + 2 * app.alert_states.dwell_seconds:
+            now += 60
+            env.feed_samples([user_id], offsets={user_id: -30.0})
+            app.update_all_plant_data([user_id], ts=now)
+    finally:
+        app.alert_dispatcher.add = dispatcher_add
+
+    if not alerts:
+        raise RuntimeError(f"{user_id} never alerted while out of range")
+    alert_after = alerts[0] - last_in_range
+    if alert_after < app.alert_states.dwell_seconds:
+        raise RuntimeError(f"{user_id} alerted {alert_after:.0f}s after its last reading in range, before the dwell time")
+    return {'alert_after_seconds': round(alert_after, 1)}
+
+
+def bench_registration(env, args):
+    """Chat registration from 'register' to a scheduled plant, photo analysis included"""
+    app = env.app
+    totals, image_phases = [], []
+    for i in range(args.registrations):
+        user_id = f'register-{i}'
+        start = time.perf_counter()
+        env.post_event(env.event_body(user_id, 'register'))
+        image_start = time.perf_counter()
+        env.post_event(env.event_body(user_id, image=True))
+        deadline = time.monotonic() + 60
+        while app.user_states.get(user_id).get('state') != 'awaiting_nickname':
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Registration image for {user_id} was not processed")
+            time.sleep(0.002)
+        image_phases.append(time.perf_counter() - image_start)
+        env.post_event(env.event_body(user_id, f'plant {i}'))
+        env.post_event(env.event_body(user_id, '2'))
+        totals.append(time.perf_counter() - start)
+        if app.get_plant_state(user_id) is None:
+            raise RuntimeError(f"Registration of {user_id} did not complete")
+    return {
+        **latency_stats(totals),
+        'image_p50_ms': round(percentile(image_phases, 50) * 1e3, 3),
+    }
+
+
+def bench_ble_ingest(env, args):
+    """Notification throughput of concurrent sensor sessions in the BLE hub"""
+    hub = env.app.ble_hub
+    addresses = [f'FA:KE:00:00:00:{i:02X}' for i in range(args.sensors)]
+    FakeBleakClient.samples = args.sensor_samples
+    FakeBleakClient.completed = 0
+
+    async def run():
+        start = time.perf_counter()
+        tasks = [asyncio.create_task(hub._device_session(address)) for address in addresses]
+        while FakeBleakClient.completed < len(addresses):
+            await asyncio.sleep(0.001)
+        elapsed = time.perf_counter() - start
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return elapsed
+
+    elapsed = asyncio.run(run())
+    notifications = len(addresses) * args.sensor_samples * len(hub.characteristics)
+    return {'notifications_per_second': round(notifications / elapsed, 1)}
+
+
+BENCHMARKS = {
+    'webhook_text': bench_webhook_text,
+    'webhook_status': bench_webhook_status,
+    'update_tick': bench_update_tick,
+    'check_thresholds': bench_check_thresholds,
+    'alert_dwell': bench_alert_dwell,
+    'registration': bench_registration,
+    'ble_ingest': bench_ble_ingest,
+}
+
+
+def higher_is_better(metric):
+    return metric.endswith('per_second')
+
+
+def compare(results, baseline, tolerance):
+    """Return (benchmark, metric, baseline, current) for every regressed metric"""
+    regressions = []
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            allowed = max(tolerance, TOLERANCES.get(f'{name}.{metric}', TOLERANCES.get(name, 0)))
+            expected = baseline.get(name, {}).get(metric)
+            if expected is None or expected == 0:
+                continue
+            if higher_is_better(metric):
+                regressed = value < expected / (1 + allowed)
+            else:
+                regressed = value > expected * (1 + allowed)
+            if regressed:
+                regressions.append((name, metric, expected, value))
+    return regressions
+
+
+def load_baseline():
+    try:
+        with open(BASELINE_PATH, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(results, args):
+    baseline = load_baseline()
+    baseline.update(results)
+    baseline['_meta'] = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'processor_count': os.cpu_count(),
+        'latency_seconds': {'line': args.line_latency, 'groq': args.groq_latency, 'plantid': args.plantid_latency},
+        'repeat': args.repeat,
+        'recorded': time.strftime('%Y-%m-%d'),
+    }
+    with open(BASELINE_PATH, 'w') as f:
+        json.dump(baseline, f, indent=4, sort_keys=True)
+        f.write('\n')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS), help="benchmarks to run")
+    parser.add_argument('--events', type=int, default=500, help="webhook events per benchmark")
+    parser.add_argument('--concurrency', type=int, default=8, help="concurrent webhook senders")
+    parser.add_argument('--tick-sizes', type=int, nargs='+', default=[10, 100, 1000], help="plants per tick")
+    parser.add_argument('--ticks', type=int, default=5, help="minimum ticks measured per size")
+    parser.add_argument('--registrations', type=int, default=20)
+    parser.add_argument('--sensors', type=int, default=20, help="concurrent fake BLE sensors")
+    parser.add_argument('--sensor-samples', type=int, default=2000, help="notification rounds per sensor")
+    parser.add_argument('--line-latency', type=float, default=0.01, help="seconds per LINE request")
+    parser.add_argument('--groq-latency', type=float, default=0.2, help="seconds per Groq completion")
+    parser.add_argument('--plantid-latency', type=float, default=0.3, help="seconds per Plant.id request")
+    parser.add_argument('--tolerance', type=float, default=1.0,
+                        help="allowed slowdown against the baseline (1.0 = 2x), at least TOLERANCES for noisy benchmarks")
+    parser.add_argument('--repeat', type=int, default=1, help="runs per benchmark; the median of each metric counts")
+    parser.add_argument('--update-baseline', action='store_true', help="store these results as the baseline")
+    parser.add_argument('--log-level', default='WARNING', help="log level of the bot while measuring")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    env = Environment(args)
+    results = {}
+    try:
+        for name in args.only or BENCHMARKS:
+            runs = []
+            for i in range(args.repeat):
+                print(f"Running {name}{f' ({i + 1}/{args.repeat})' if args.repeat > 1 else ''}...", flush=True)
+                runs.append(BENCHMARKS[name](env, args))
+            results[name] = {metric: percentile([run[metric] for run in runs], 50) for metric in runs[0]}
+    finally:
+        env.close()
+
+    for name, metrics in results.items():
+        print(f"\n{name}")
+        for metric, value in metrics.items():
+            print(f"  {metric:<28} {value:>12}")
+
+    if args.update_baseline:
+        save_baseline(results, args)
+        print(f"\nBaseline written to {BASELINE_PATH}")
+        return 0
+
+    regressions = compare(results, load_baseline(), args.tolerance)
+    if regressions:
+        print("\nRegressions:")
+        for name, metric, expected, value in regressions:
+            print(f"  {name}.{metric}: {value} (baseline {expected})")
+        return 1
+    print("\nNo regressions against the baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,207 @@
+import asyncio
+import json
+import os
+import struct
+import threading
+import logging
+from pathlib import Path
+
+from bleak import BleakClient, BleakScanner
+
+from sensor_ingest import SampleAggregator
+
+logger = logging.getLogger(__name__)
+
+# Characteristics carry one little-endian 32-bit float
+FLOAT_VALUE = struct.Struct('<f')
+
+
+class BleHub:
+    """Keep concurrent BLE sessions to every plant sensor in range.
+
+    Each device runs in its own asyncio task with its own BleakClient and
+    reconnect loop, so a slow or flaky sensor never delays the others.
+    Notifications are routed by device address, and every device can be
+    bound to the user whose plant it sits in.
+    """
+
+    def __init__(self, bindings_path, characteristics, name_filter="Plant",
+                 scan_interval=30, connect_timeout=20, max_retries=5):
+        self.bindings_path = Path(bindings_path)
+        self.characteristics = {uuid.lower(): metric for uuid, metric in characteristics.items()}
+        self.name_filter = name_filter
+        self.scan_interval = scan_interval
+        self.connect_timeout = connect_timeout
+        self.max_retries = max_retries
+        self.readings = {}
+        self.aggregators = {}
+        self.connected = set()
+        # Notifications per metric ('other' for unmapped characteristics); only
+        # the event loop writes these, so the hot path needs no lock
+        self.notification_counts = dict.fromkeys(tuple(self.characteristics.values()) + ('other',), 0)
+        self._tasks = {}
+        self._lock = threading.Lock()
+        self.bindings = self._load_bindings()
+
+    def _load_bindings(self):
+        try:
+            with open(self.bindings_path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError as e:
+            logger.error(f"Could not read device bindings: {str(e)}")
+            return {}
+
+    def _save_bindings(self):
+        tmp_path = self.bindings_path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self.bindings, f, indent=4)
+        os.replace(tmp_path, self.bindings_path)
+
+    def bind(self, address, user_id):
+        """Bind a sensor to a user's plant, replacing any earlier binding of that user"""
+        address = address.upper()
+        with self._lock:
+            for other in [a for a, u in self.bindings.items() if u == user_id]:
+                del self.bindings[other]
+            self.bindings[address] = user_id
+            self._save_bindings()
+        logger.info(f"Bound sensor {address} to {user_id}")
+
+    def unbind(self, user_id):
+        with self._lock:
+            for address in [a for a, u in self.bindings.items() if u == user_id]:
+                del self.bindings[address]
+            self._save_bindings()
+
+    def _snapshot(self):
+        """Copies of the bindings and connected devices, safe to iterate from any thread"""
+        # The event loop adds and drops connected devices without the lock;
+        # copying is a single C call, so it cannot see the set change midway
+        connected = self.connected.copy()
+        with self._lock:
+            bindings = dict(self.bindings)
+        return bindings, connected
+
+    def device_for_user(self, user_id):
+        """Return the sensor address feeding a user's plant, or None"""
+        bindings, connected = self._snapshot()
+        for address, bound_user in bindings.items():
+            if bound_user == user_id:
+                return address
+        # Single-sensor setups keep working without an explicit binding
+        unbound = [a for a in connected if a not in bindings]
+        if len(connected) == 1 and len(unbound) == 1:
+            return unbound[0]
+        return None
+
+    def unbound_devices(self):
+        bindings, connected = self._snapshot()
+        return sorted(a for a in connected if a not in bindings)
+
+    def readings_for_user(self, user_id):
+        """Return a copy of the latest readings for a user's plant, or None"""
+        address = self.device_for_user(user_id)
+        readings = self.readings.get(address) if address else None
+        return dict(readings) if readings else None
+
+    def interval_stats_for_user(self, user_id):
+        """Return per-metric stats of the samples since the last call, or None"""
+        return self.interval_stats_for_users([user_id]).get(user_id)
+
+    def interval_stats_for_users(self, user_ids):
+        """Return {user_id: per-metric stats of the samples since the last call}.
+
+        Each sensor is emitted once per call and its stats are shared by
+        every plant it feeds, so plants on the single-sensor fallback all
+        get the same interval when they are updated together. Plants
+        sharing that sensor but falling due in different ticks still split
+        its samples between them. Users without a sensor are left out.
+        """
+        emitted = {}
+        stats = {}
+        for user_id in user_ids:
+            address = self.device_for_user(user_id)
+            if address is None:
+                continue
+            if address not in emitted:
+                aggregator = self.aggregators.get(address)
+                emitted[address] = aggregator.emit() if aggregator else None
+            stats[user_id] = emitted[address]
+        return stats
+
+    def _make_handler(self, address):
+        readings = self.readings.setdefault(address, {})
+        aggregator = self.aggregators.setdefault(address, SampleAggregator(tuple(self.characteristics.values())))
+        metrics_by_uuid = self.characteristics
+        counts = self.notification_counts
+        unpack = FLOAT_VALUE.unpack
+
+        def handle(sender, data):
+            # Hot path: no per-sample logging or string formatting
+            metric = metrics_by_uuid.get(sender.uuid.lower())
+            if metric is None:
+                counts['other'] += 1
+                return
+            counts[metric] += 1
+            try:
+                value = unpack(data)[0]
+            except struct.error:
+                logger.error("Error unpacking data from %s: %s", address, data.hex())
+                return
+            # Round the value to 1 decimal place for consistency
+            readings[metric] = round(value, 1)
+            aggregator.add(metric, value)
+
+        return handle
+
+    async def _device_session(self, address):
+        """Hold a connection to one device, reconnecting with backoff"""
+        failures = 0
+        while failures < self.max_retries:
+            disconnected = asyncio.Event()
+            try:
+                async with BleakClient(
+                    address,
+                    timeout=self.connect_timeout,
+                    disconnected_callback=lambda client: disconnected.set()
+                ) as client:
+                    handler = self._make_handler(address)
+                    for uuid in self.characteristics:
+                        await client.start_notify(uuid, handler)
+                    self.connected.add(address)
+                    failures = 0
+                    logger.info(f"Connected to sensor {address}")
+                    await disconnected.wait()
+                    logger.warning(f"Sensor {address} disconnected")
+            except Exception as e:
+                failures += 1
+                logger.error(f"Sensor {address} error ({failures}/{self.max_retries}): {str(e)}")
+            finally:
+                self.connected.discard(address)
+            await asyncio.sleep(min(60, 2 ** failures))
+
+        # Give up until the device shows up in a scan again
+        logger.warning(f"Giving up on sensor {address}")
+
+    async def scan(self):
+        """Start a session task for every matching device not yet handled"""
+        devices = await BleakScanner.discover()
+        for d in devices:
+            if not (d.name and self.name_filter in d.name):
+                continue
+            address = d.address.upper()
+            task = self._tasks.get(address)
+            if task is None or task.done():
+                logger.info(f"Found sensor {d.name} at {address}")
+                self._tasks[address] = asyncio.create_task(self._device_session(address))
+
+    async def run(self):
+        """Scan for new sensors forever"""
+        while True:
+            try:
+                await self.scan()
+            except Exception as e:
+                logger.error(f"BLE scan failed: {str(e)}")
+            await asyncio.sleep(self.scan_interval)
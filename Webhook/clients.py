@@ -0,0 +1,261 @@
+import os
+import random
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import groq
+import requests
+from groq import Groq
+from requests.adapters import HTTPAdapter
+
+import metrics
+import tracing
+
+logger = logging.getLogger(__name__)
+
+GROQ_MODEL = "llama3-8b-8192"
+
+# (connect, read) timeouts in seconds for every outbound endpoint
+ENDPOINT_TIMEOUTS = {
+    'plantid_identify': (5, 30),
+    'plantid_health': (5, 30),
+    'groq': 20,
+    'line_content': (5, 30),
+}
+
+# Transient failures worth another attempt
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+GROQ_RETRY_ERRORS = (groq.APIConnectionError, groq.RateLimitError, groq.InternalServerError)
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is refused because its circuit breaker is open"""
+
+
+class DeadlineExceeded(Exception):
+    """Raised when an LLM reply does not arrive within its deadline"""
+
+
+class CircuitBreaker:
+    """Stop calling an endpoint after repeated failures.
+
+    After failure_threshold consecutive failures the breaker opens and
+    refuses calls for reset_timeout seconds, then lets a single trial call
+    through (half-open) and closes again if it succeeds.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return 'closed'
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        """Raise CircuitOpenError unless a call may go through now"""
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return
+            if state == 'half-open' and not self._trial_running:
+                self._trial_running = True
+                return
+        raise CircuitOpenError(f"Circuit for {self.name} is open")
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning(f"Opening circuit for {self.name} after {self._failures} failures")
+                self._opened_at = time.monotonic()
+
+
+breakers = {name: CircuitBreaker(name) for name in ENDPOINT_TIMEOUTS}
+
+call_seconds = metrics.histogram(
+    'plantita_external_call_seconds', "Latency of each attempt to call an external API",
+    ('endpoint', 'outcome')
+)
+call_errors = metrics.counter(
+    'plantita_external_call_errors', "Failed external API attempts by error type",
+    ('endpoint', 'error')
+)
+BREAKER_STATES = {'closed': 0, 'half-open': 1, 'open': 2}
+metrics.gauge_callback(
+    'plantita_circuit_state', "Circuit breaker state (0 closed, 1 half-open, 2 open)",
+    lambda: {(name,): BREAKER_STATES[breaker.state] for name, breaker in breakers.items()},
+    ('endpoint',)
+)
+
+
+def retry_call(func, should_retry, attempts=3, base_delay=0.5, max_delay=8.0):
+    """Call func, retrying with full-jitter exponential backoff"""
+    for attempt in range(attempts):
+        try:
+            return func()
+        except Exception as e:
+            if attempt == attempts - 1 or not should_retry(e):
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            logger.warning(f"Attempt {attempt + 1} failed ({str(e)}), retrying in {delay:.2f}s")
+            time.sleep(delay)
+
+
+def observed_call(endpoint, func):
+    """Call func once, recording its latency and errors under endpoint"""
+    start = time.perf_counter()
+    try:
+        with tracing.span(endpoint):
+            result = func()
+    except Exception as e:
+        call_seconds.labels(endpoint, 'error').observe(time.perf_counter() - start)
+        call_errors.labels(endpoint, type(e).__name__).inc()
+        raise
+    call_seconds.labels(endpoint, 'ok').observe(time.perf_counter() - start)
+    return result
+
+
+def guarded_call(endpoint, func, should_retry, **retry_options):
+    """Run func with retries behind the endpoint's circuit breaker"""
+    breaker = breakers[endpoint]
+
+    def attempt():
+        try:
+            breaker.allow()
+        except CircuitOpenError:
+            call_errors.labels(endpoint, 'CircuitOpenError').inc()
+            raise
+        try:
+            result = observed_call(endpoint, func)
+        except Exception as e:
+            if should_retry(e):
+                breaker.record_failure()
+            else:
+                # The endpoint answered; the request itself was bad
+                breaker.record_success()
+            raise
+        breaker.record_success()
+        return result
+
+    return retry_call(attempt, should_retry, **retry_options)
+
+
+# One pooled keep-alive session for all plain HTTP APIs
+http_session = requests.Session()
+for prefix in ('https://', 'http://'):
+    http_session.mount(prefix, HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+
+def _should_retry_http(e):
+    if isinstance(e, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(e, requests.HTTPError) and e.response is not None:
+        return e.response.status_code in RETRY_STATUS_CODES
+    return False
+
+
+def post_json(endpoint, url, **kwargs):
+    """POST through the shared session with the endpoint's timeout, retries and breaker"""
+    kwargs.setdefault('timeout', ENDPOINT_TIMEOUTS[endpoint])
+
+    def send():
+        response = http_session.post(url, **kwargs)
+        response.raise_for_status()
+        return response
+
+    return guarded_call(endpoint, send, _should_retry_http)
+
+
+def get_stream(endpoint, url, **kwargs):
+    """GET a streamed response through the shared session; the caller must close it"""
+    kwargs.setdefault('timeout', ENDPOINT_TIMEOUTS[endpoint])
+
+    def send():
+        response = http_session.get(url, stream=True, **kwargs)
+        try:
+            response.raise_for_status()
+        except Exception:
+            response.close()
+            raise
+        return response
+
+    return guarded_call(endpoint, send, _should_retry_http)
+
+
+_groq_client = None
+_groq_lock = threading.Lock()
+
+
+def get_groq_client():
+    """Return the process-wide Groq client, creating it on first use"""
+    global _groq_client
+    if _groq_client is None:
+        with _groq_lock:
+            if _groq_client is None:
+                # Retries are done by guarded_call so they share the breaker
+                _groq_client = Groq(
+                    api_key=os.getenv('GROQ_API_KEY'),
+                    timeout=ENDPOINT_TIMEOUTS['groq'],
+                    max_retries=0
+                )
+    return _groq_client
+
+
+def _chat_completion(prompt, model):
+    def send():
+        return get_groq_client().chat.completions.create(
+            messages=[{"role": "user", "content": prompt}],
+            model=model
+        )
+
+    response = guarded_call('groq', send, lambda e: isinstance(e, GROQ_RETRY_ERRORS))
+    return response.choices[0].message.content
+
+
+# Completions with a deadline run here so the caller can stop waiting
+_llm_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='llm')
+
+
+def chat_completion(prompt, model=GROQ_MODEL, deadline=None, on_late_reply=None):
+    """Send a single-message chat completion to Groq and return the reply text.
+
+    With a deadline (seconds), DeadlineExceeded is raised once it passes.
+    The request keeps running, and on_late_reply(text) is called if it
+    still succeeds.
+    """
+    if deadline is None:
+        return _chat_completion(prompt, model)
+
+    future = _llm_executor.submit(tracing.continue_trace(_chat_completion, 'llm_request'), prompt, model)
+    try:
+        return future.result(timeout=deadline)
+    except FutureTimeoutError:
+        if on_late_reply is not None:
+            def deliver(done):
+                if done.exception() is None:
+                    try:
+                        on_late_reply(done.result())
+                    except Exception as e:
+                        logger.error(f"Late LLM reply handler failed: {str(e)}")
+            future.add_done_callback(deliver)
+        raise DeadlineExceeded(f"No LLM reply within {deadline}s")
@@ -0,0 +1,141 @@
+# Replies rendered locally when the LLM misses its deadline, and data
+# summaries that never need it. They use the same readings and thresholds
+# the prompts are built from.
+
+METRIC_UNITS = {
+    'temperature': '°C',
+    'humidity': '%',
+    'moisture': '%',
+    'light': '%',
+}
+
+CARE_TIPS = {
+    ('temperature', 'low'): "move it somewhere warmer, away from drafts and cold windows",
+    ('temperature', 'high'): "move it out of direct sun or away from heaters, and give it some airflow",
+    ('humidity', 'low'): "mist the leaves or place it on a tray of wet pebbles",
+    ('humidity', 'high'): "improve the airflow around it and avoid misting for now",
+    ('moisture', 'low'): "give it a good drink of water",
+    ('moisture', 'high'): "hold off on watering and check that the pot drains well",
+    ('light', 'low'): "move it closer to a bright window",
+    ('light', 'high'): "move it out of harsh direct light",
+}
+
+
+def _format_value(metric, value):
+    return f"{value:g}{METRIC_UNITS.get(metric, '')}" if isinstance(value, (int, float)) else str(value)
+
+
+def _metric_name(metric):
+    return metric.replace('_', ' ').title()
+
+
+def format_eta(seconds):
+    """Rough time until a predicted breach, e.g. '~6 hours'"""
+    if seconds < 5400:
+        return f"~{max(5, round(seconds / 600) * 10)} minutes"
+    return f"~{round(seconds / 3600)} hours"
+
+
+def render_status(nickname, scientific_name, reading, thresholds):
+    """Status update for a plant from its latest reading"""
+    lines = [f"Here's how {nickname} ({scientific_name}) is doing 🌿\n"]
+    tips = []
+    for metric, value in reading.items():
+        if not isinstance(value, (int, float)) or metric not in (thresholds or {}):
+            continue
+        low, high = thresholds[metric]['min'], thresholds[metric]['max']
+        if value < low:
+            mark, tip = '⬇️', CARE_TIPS.get((metric, 'low'))
+        elif value > high:
+            mark, tip = '⬆️', CARE_TIPS.get((metric, 'high'))
+        else:
+            mark, tip = '✅', None
+        lines.append(
+            f"{mark} {_metric_name(metric)}: {_format_value(metric, value)} "
+            f"(ideal {_format_value(metric, low)}–{_format_value(metric, high)})"
+        )
+        if tip:
+            tips.append(f"• {_metric_name(metric)}: {tip}")
+
+    if tips:
+        lines.append("\nA few things that would help:\n" + "\n".join(tips))
+    else:
+        lines.append("\nEverything looks good! Keep doing what you're doing 💚")
+    return "\n".join(lines)
+
+
+def render_alert(entries):
+    """One alert message for the entries of an alert digest"""
+    sections = []
+    for entry in entries:
+        lines = [f"⚠️ {entry['plant_nickname']} needs some attention:"]
+        for alert in entry['alerts']:
+            condition = 'too low' if alert['condition'] == 'low' else 'too high'
+            metric = alert['metric']
+            tip = CARE_TIPS.get((metric, alert['condition']))
+            if 'eta_seconds' in alert:
+                eta = format_eta(alert['eta_seconds'])
+                lines.append(
+                    f"• {_metric_name(metric)} will be {condition} in {eta}: {_format_value(metric, alert['value'])} now "
+                    f"(ideal: {_format_value(metric, alert['threshold'])})"
+                )
+                if tip:
+                    lines.append(f"  → Within {eta}, please {tip}.")
+                continue
+            lines.append(
+                f"• {_metric_name(metric)} is {condition}: {_format_value(metric, alert['value'])} "
+                f"(ideal: {_format_value(metric, alert['threshold'])})"
+            )
+            if tip:
+                lines.append(f"  → Please {tip}.")
+        sections.append("\n".join(lines))
+    return "\n\n".join(sections) + "\n\nI'll keep an eye on things for you 💚"
+
+
+def render_description(plant_name, nickname, plant_details):
+    """Short care guide for a newly registered plant"""
+    watering_info = plant_details.get('best_watering', 'Regular watering when soil feels dry')
+    light_info = plant_details.get('best_light_condition', 'Moderate indirect light')
+    soil_info = plant_details.get('best_soil_type', 'Well-draining potting mix')
+    return (
+        f"Your beloved {nickname}, a beautiful {plant_name} 🌱\n\n"
+        f"Care basics:\n"
+        f"💧 Watering: {watering_info}\n"
+        f"☀️ Light: {light_info}\n"
+        f"🪴 Soil: {soil_info}"
+    )
+
+
+def render_health_assessment(plant_name, health_data):
+    """Health summary from a Plant.id health assessment"""
+    if health_data.get('status') == 'error':
+        return f"I couldn't get a clear look at {plant_name}'s health right now. Please try again with another photo 📸"
+
+    if health_data.get('is_healthy'):
+        text = f"Good news! {plant_name} looks healthy 💚"
+    else:
+        text = f"{plant_name} is showing some signs of stress 🩺"
+
+    names = [d.get('name') for d in health_data.get('diseases', []) if isinstance(d, dict) and d.get('name')]
+    if names:
+        text += "\n\nPossible issues: " + ", ".join(names[:3])
+    return text + "\n\nKeep an eye on its leaves and soil, and send me another photo anytime!"
+
+
+def render_week(nickname, summary, thresholds, days=7):
+    """Min/mean/max of each metric over the last days, from the rollups"""
+    if not summary:
+        return f"I don't have any readings for {nickname} from the last {days} days yet 📡"
+
+    lines = [f"Here's {nickname}'s last {days} days 📊\n"]
+    for metric, stats in summary.items():
+        line = (
+            f"• {_metric_name(metric)}: avg {_format_value(metric, round(stats['mean'], 1))} "
+            f"(low {_format_value(metric, round(stats['min'], 1))}, high {_format_value(metric, round(stats['max'], 1))})"
+        )
+        if metric in (thresholds or {}):
+            low, high = thresholds[metric]['min'], thresholds[metric]['max']
+            if stats['min'] < low or stats['max'] > high:
+                line += f" — left the ideal {_format_value(metric, low)}–{_format_value(metric, high)} at times"
+        lines.append(line)
+    return "\n".join(lines)
@@ -0,0 +1,106 @@
+import base64
+import io
+import multiprocessing
+import os
+import threading
+import logging
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from plantid_cache import content_hash
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    # Without Pillow photos are uploaded as they are
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Plant.id does not gain accuracy from more pixels than this
+DEFAULT_MAX_SIDE = 1024
+DEFAULT_JPEG_QUALITY = 85
+
+
+def encode_image(image_path, max_side=DEFAULT_MAX_SIDE, quality=DEFAULT_JPEG_QUALITY):
+    """Reorient, downscale and recompress an image; returns it base64-encoded"""
+    with open(image_path, 'rb') as f:
+        raw = f.read()
+
+    data = raw
+    if Image is not None:
+        try:
+            with Image.open(io.BytesIO(raw)) as image:
+                image = ImageOps.exif_transpose(image)
+                image.thumbnail((max_side, max_side))
+                if image.mode != 'RGB':
+                    image = image.convert('RGB')
+                buffer = io.BytesIO()
+                image.save(buffer, 'JPEG', quality=quality, optimize=True)
+            # Small originals can come out larger; never upload more than we have
+            if buffer.tell() < len(raw):
+                data = buffer.getvalue()
+        except Exception:
+            data = raw
+
+    return base64.b64encode(data).decode('ascii')
+
+
+def _warm_up():
+    return os.getpid()
+
+
+class ImagePreprocessor:
+    """Prepare Plant.id image payloads in a process pool and keep the latest ones.
+
+    The same photo is usually sent to /identify and later to
+    /health_assessment, so encoded payloads are cached by the SHA-256 of
+    the image bytes. The image store touches a photo when the same one is
+    sent again, so path and mtime would miss. Concurrent requests for one
+    image share a single job.
+    """
+
+    def __init__(self, workers=2, max_side=DEFAULT_MAX_SIDE, quality=DEFAULT_JPEG_QUALITY,
+                 cache_entries=32, timeout=30):
+        self.workers = workers
+        self.max_side = max_side
+        self.quality = quality
+        self.cache_entries = cache_entries
+        self.timeout = timeout
+        self._pool = None
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Create the worker processes; call before other threads are started"""
+        with self._lock:
+            if self._pool is None:
+                # fork keeps workers from re-importing the web app's main module
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+        self._pool.submit(_warm_up).result()
+
+    def submit(self, image_path):
+        """Start encoding an image if it is not cached yet; returns a Future"""
+        key = content_hash(image_path)
+        with self._lock:
+            future = self._cache.get(key)
+            if future is None or (future.done() and future.exception() is not None):
+                if self._pool is None:
+                    raise RuntimeError("ImagePreprocessor.start() was not called")
+                future = self._pool.submit(encode_image, image_path, self.max_side, self.quality)
+                self._cache[key] = future
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+        return future
+
+    def get_payload(self, image_path):
+        """Return the base64 payload of an image, falling back to the original bytes"""
+        try:
+            return self.submit(image_path).result(timeout=self.timeout)
+        except Exception as e:
+            logger.warning(f"Image preprocessing failed for {image_path}: {str(e)}")
+            with open(image_path, 'rb') as f:
+                return base64.b64encode(f.read()).decode('ascii')
@@ -0,0 +1,105 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+import logging
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RETENTION_SECONDS = 7 * 24 * 3600
+DEFAULT_MAX_BYTES = 500 * 1024 * 1024
+
+
+class ImageStore:
+    """Content-addressed image folder with retention and a size quota.
+
+    Images are streamed to a temporary file while being hashed and then
+    renamed to '<sha256><suffix>', so the same photo is stored once and
+    never held in memory as a whole. A background sweeper removes images
+    older than retention_seconds and then the least recently saved ones
+    until the folder fits in max_bytes.
+    """
+
+    def __init__(self, folder, retention_seconds=DEFAULT_RETENTION_SECONDS,
+                 max_bytes=DEFAULT_MAX_BYTES, sweep_interval=600):
+        self.folder = Path(folder)
+        self.retention_seconds = retention_seconds
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self._sweeper = None
+
+    def save_stream(self, chunks, suffix='.jpg'):
+        """Write an iterable of byte chunks to the store; returns the image path"""
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.folder, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    if chunk:
+                        digest.update(chunk)
+                        f.write(chunk)
+
+            path = self.folder / f'{digest.hexdigest()}{suffix}'
+            if path.exists():
+                # Already stored: keep the existing copy and mark it as recently used
+                os.remove(tmp_path)
+                os.utime(path)
+                logger.info(f"Image already stored: {path}")
+            else:
+                os.replace(tmp_path, path)
+                logger.info(f"Image saved: {path}")
+            return str(path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def save_bytes(self, data, suffix='.jpg'):
+        return self.save_stream([data], suffix=suffix)
+
+    def sweep(self, now=None):
+        """Apply retention and the size quota; returns the number of files removed"""
+        now = time.time() if now is None else now
+        files = []
+        for path in self.folder.iterdir():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+
+        removed = 0
+        total = sum(size for _, size, _ in files)
+        for mtime, size, path in files:
+            if mtime >= now - self.retention_seconds and total <= self.max_bytes:
+                break
+            # Partial files may still be downloading; only clearly stale ones go
+            if path.suffix == '.part' and mtime >= now - 3600:
+                continue
+            path.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+
+        if removed:
+            logger.info(f"Image sweep removed {removed} files, {total} bytes left")
+        return removed
+
+    def start_sweeper(self):
+        """Run sweep() every sweep_interval seconds in a daemon thread"""
+        if self._sweeper is not None:
+            return
+
+        def run():
+            while True:
+                try:
+                    self.sweep()
+                except Exception as e:
+                    logger.error(f"Image sweep failed: {str(e)}")
+                time.sleep(self.sweep_interval)
+
+        self._sweeper = threading.Thread(target=run, name='image-sweeper', daemon=True)
+        self._sweeper.start()
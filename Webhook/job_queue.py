@@ -0,0 +1,92 @@
+import itertools
+import queue
+import threading
+import time
+import logging
+from collections import OrderedDict
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+job_wait_seconds = metrics.histogram(
+    'plantita_job_wait_seconds', "Time jobs spend queued before a worker picks them up", ('queue',)
+)
+job_run_seconds = metrics.histogram(
+    'plantita_job_run_seconds', "Time jobs take to run", ('queue', 'outcome')
+)
+
+
+class JobQueue:
+    """Bounded job queue served by a pool of worker threads.
+
+    submit() raises queue.Full instead of blocking when the queue is at
+    capacity, so request handlers can shed load. The status of the most
+    recent jobs is kept for inspection.
+    """
+
+    def __init__(self, name, workers=4, max_pending=100, history_size=1000):
+        self.name = name
+        self.workers = workers
+        self.history_size = history_size
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._threads = []
+
+    def start(self):
+        """Start the worker threads"""
+        for i in range(self.workers - len(self._threads)):
+            thread = threading.Thread(target=self._run, name=f'{self.name}-{len(self._threads)}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    @property
+    def depth(self):
+        return self._queue.qsize()
+
+    def submit(self, func, *args, **kwargs):
+        """Queue func(*args, **kwargs); returns the job id"""
+        job_id = f'{self.name}-{next(self._ids)}'
+        job = {
+            'id': job_id,
+            'name': getattr(func, '__name__', repr(func)),
+            'state': 'queued',
+            'submitted': time.time(),
+            'started': None,
+            'finished': None,
+            'error': None,
+        }
+        self._queue.put_nowait((job, func, args, kwargs))
+
+        with self._lock:
+            self._jobs[job_id] = job
+            while len(self._jobs) > self.history_size:
+                self._jobs.popitem(last=False)
+        return job_id
+
+    def status(self, job_id):
+        """Return a copy of a job's status, or None if unknown"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _run(self):
+        wait_timer = job_wait_seconds.labels(self.name)
+        while True:
+            job, func, args, kwargs = self._queue.get()
+            job['state'] = 'running'
+            job['started'] = time.time()
+            wait_timer.observe(job['started'] - job['submitted'])
+            try:
+                func(*args, **kwargs)
+                job['state'] = 'done'
+            except Exception as e:
+                job['state'] = 'failed'
+                job['error'] = str(e)
+                logger.error(f"Job {job['id']} ({job['name']}) failed: {str(e)}", exc_info=True)
+            finally:
+                job['finished'] = time.time()
+                job_run_seconds.labels(self.name, job['state']).observe(job['finished'] - job['started'])
+                self._queue.task_done()
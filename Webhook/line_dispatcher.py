@@ -0,0 +1,291 @@
+import heapq
+import json
+import random
+import sqlite3
+import threading
+import time
+import uuid
+import logging
+from contextlib import contextmanager
+
+from linebot.v3.messaging import ApiException, TextMessage
+
+import metrics
+from clients import observed_call
+
+logger = logging.getLogger(__name__)
+
+# LINE accepts up to 500 recipients per multicast request
+MULTICAST_LIMIT = 500
+
+# Request rates LINE allows per channel (requests per second)
+LINE_RATE_LIMITS = {
+    'line_push': 2000,
+    'line_multicast': 200,
+}
+
+messages_sent = metrics.counter(
+    'plantita_line_messages', "Outbound LINE messages by outcome", ('outcome',)
+)
+
+
+class TokenBucket:
+    """Allow rate calls per second on average with bursts of up to capacity.
+
+    acquire() blocks until a token is free. pause() empties the bucket
+    for a while, e.g. after the server answered 429.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, 0) - seconds * self.rate
+
+
+class LineDispatcher:
+    """Persistent outbound queue for LINE push and multicast messages.
+
+    push() only stores the message and returns, so callers such as the
+    monitoring loop never wait on LINE. A pool of worker threads sends
+    the queued messages, each request taking a token from the bucket of
+    its endpoint. Requests that fail with 429, a 5xx status or a
+    connection error are retried with full-jitter exponential backoff
+    under the same retry key, so LINE drops any duplicates. Other 4xx
+    errors are dropped.
+
+    A text pushed while the same text is still queued for other users is
+    added to that message's recipients; a user who already has it queued
+    gets a message of their own, so repeated messages are all delivered. A message with several recipients
+    is sent through the multicast endpoint. Queued messages are kept in
+    SQLite and resent after a restart.
+    """
+
+    def __init__(self, line_bot_api, db_path, workers=4, max_attempts=6, base_delay=1.0, max_delay=300.0,
+                 rate_limits=None):
+        self.line_bot_api = line_bot_api
+        self.db_path = str(db_path)
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.buckets = {
+            endpoint: TokenBucket(rate) for endpoint, rate in dict(LINE_RATE_LIMITS, **(rate_limits or {})).items()
+        }
+        self._entries = {}
+        self._ready = []
+        # Text -> id of the queued message it can still be added to
+        self._open = {}
+        self._sending = 0
+        self._cond = threading.Condition()
+        self._threads = []
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS outbox ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, recipients TEXT NOT NULL, text TEXT NOT NULL, "
+                "retry_key TEXT NOT NULL, attempts INTEGER NOT NULL, not_before REAL NOT NULL)"
+            )
+            rows = conn.execute("SELECT id, recipients, text, retry_key, attempts, not_before FROM outbox").fetchall()
+        for entry_id, recipients, text, retry_key, attempts, not_before in rows:
+            self._entries[entry_id] = {
+                'id': entry_id,
+                'recipients': json.loads(recipients),
+                'text': text,
+                'retry_key': retry_key,
+                'attempts': attempts,
+                'not_before': not_before,
+            }
+            heapq.heappush(self._ready, (not_before, entry_id))
+        if rows:
+            logger.info(f"Resending {len(rows)} queued LINE messages")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @property
+    def depth(self):
+        """Messages waiting to be sent"""
+        return len(self._entries) - self._sending
+
+    def start(self):
+        """Start the worker threads"""
+        for i in range(self.workers - len(self._threads)):
+            thread = threading.Thread(target=self._run, name=f'line-sender-{len(self._threads)}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def drain(self, timeout=None):
+        """Wait until every queued message is sent or dropped; returns whether it was"""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._entries, timeout)
+
+    def push(self, user_id, text):
+        """Queue a text message for one user"""
+        self.multicast([user_id], text)
+
+    def multicast(self, user_ids, text):
+        """Queue the same text message for several users"""
+        user_ids = list(dict.fromkeys(user_ids))
+        with self._cond:
+            # Top up a queued message with the same text before adding new ones
+            entry = self._entries.get(self._open.get(text))
+            if entry is not None:
+                # Users who already have this text queued get it again in a new message
+                room = MULTICAST_LIMIT - len(entry['recipients'])
+                queued = set(entry['recipients'])
+                added = [user_id for user_id in user_ids if user_id not in queued][:room]
+                if added:
+                    entry['recipients'].extend(added)
+                    with self._connect() as conn:
+                        conn.execute(
+                            "UPDATE outbox SET recipients = ? WHERE id = ?",
+                            (json.dumps(entry['recipients']), entry['id'])
+                        )
+                    added = set(added)
+                    user_ids = [user_id for user_id in user_ids if user_id not in added]
+
+            now = time.time()
+            for i in range(0, len(user_ids), MULTICAST_LIMIT):
+                recipients = user_ids[i:i + MULTICAST_LIMIT]
+                retry_key = str(uuid.uuid4())
+                with self._connect() as conn:
+                    entry_id = conn.execute(
+                        "INSERT INTO outbox (recipients, text, retry_key, attempts, not_before) VALUES (?, ?, ?, 0, ?)",
+                        (json.dumps(recipients), text, retry_key, now)
+                    ).lastrowid
+                self._entries[entry_id] = {
+                    'id': entry_id,
+                    'recipients': recipients,
+                    'text': text,
+                    'retry_key': retry_key,
+                    'attempts': 0,
+                    'not_before': now,
+                }
+                self._open[text] = entry_id
+                heapq.heappush(self._ready, (now, entry_id))
+            self._cond.notify_all()
+
+    def _next(self):
+        """Block until a queued message is due and take it"""
+        with self._cond:
+            while True:
+                if self._ready:
+                    not_before, entry_id = self._ready[0]
+                    wait = not_before - time.time()
+                    if wait <= 0:
+                        heapq.heappop(self._ready)
+                        entry = self._entries[entry_id]
+                        if self._open.get(entry['text']) == entry_id:
+                            del self._open[entry['text']]
+                        self._sending += 1
+                        return entry
+                    self._cond.wait(wait)
+                else:
+                    self._cond.wait()
+
+    def _run(self):
+        while True:
+            entry = self._next()
+            try:
+                self._send(entry)
+            except Exception as e:
+                self._failed(entry, e)
+            else:
+                self._done(entry, 'sent')
+
+    @staticmethod
+    def _endpoint(entry):
+        return 'line_push' if len(entry['recipients']) == 1 else 'line_multicast'
+
+    def _send(self, entry):
+        endpoint = self._endpoint(entry)
+        messages = [TextMessage(text=entry['text'])]
+        if endpoint == 'line_push':
+            request = {'to': entry['recipients'][0], 'messages': messages}
+            send = self.line_bot_api.push_message_with_http_info
+        else:
+            request = {'to': entry['recipients'], 'messages': messages}
+            send = self.line_bot_api.multicast_with_http_info
+
+        self.buckets[endpoint].acquire()
+        try:
+            observed_call(endpoint, lambda: send(request, x_line_retry_key=entry['retry_key']))
+        except ApiException as e:
+            # The retry key was already accepted: an earlier attempt got through
+            if e.status != 409:
+                raise
+
+    def _failed(self, entry, e):
+        status = e.status if isinstance(e, ApiException) else None
+        # ApiException's own text carries every response header
+        error = f"{status} {e.reason}" if status is not None else str(e)
+        if status is not None and 400 <= status < 500 and status != 429:
+            logger.error(f"LINE rejected message {entry['id']}, dropping it: {error}")
+            self._done(entry, 'rejected')
+            return
+
+        entry['attempts'] += 1
+        if entry['attempts'] >= self.max_attempts:
+            logger.error(f"Giving up on message {entry['id']} after {entry['attempts']} attempts: {error}")
+            self._done(entry, 'failed')
+            return
+
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** entry['attempts']))
+        if status == 429:
+            retry_after = (e.headers or {}).get('Retry-After')
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            # Every request to this endpoint would be throttled too
+            self.buckets[self._endpoint(entry)].pause(delay)
+        logger.warning(f"Sending message {entry['id']} failed ({error}), retrying in {delay:.1f}s")
+        messages_sent.labels('retried').inc()
+
+        entry['not_before'] = time.time() + delay
+        with self._cond:
+            with self._connect() as conn:
+                conn.execute(
+                    "UPDATE outbox SET attempts = ?, not_before = ? WHERE id = ?",
+                    (entry['attempts'], entry['not_before'], entry['id'])
+                )
+            self._sending -= 1
+            heapq.heappush(self._ready, (entry['not_before'], entry['id']))
+            self._cond.notify()
+
+    def _done(self, entry, outcome):
+        with self._cond:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM outbox WHERE id = ?", (entry['id'],))
+            del self._entries[entry['id']]
+            self._sending -= 1
+            self._cond.notify_all()
+        messages_sent.labels(outcome).inc(len(entry['recipients']))
@@ -1,18 +1,23 @@
 import asyncio
 import json
-import os
-from datetime import datetime, timedelta
+from datetime import datetime
 from pathlib import Path
 import logging
 from bleak import BleakClient, BleakScanner
 import struct
-from groq import Groq
 from collections import deque
+from reading_store import ReadingStore
+from reading_history import ReadingHistory
+from threshold_cache import ThresholdCache, parse_thresholds
+from clients import chat_completion
 
 # Constants
 TEMP_CHARACTERISTIC_UUID = "00002a6e-0000-1000-8000-00805f9b34fb"
 HUMIDITY_CHARACTERISTIC_UUID = "00002a6f-0000-1000-8000-00805f9b34fb"
 SOIL_MOISTURE_CHARACTERISTIC_UUID = "00002a70-0000-1000-8000-00805f9b34fb"
+THRESHOLD_METRICS = ('temperature', 'humidity', 'light', 'moisture')
+# Name the bot gives plants Plant.id could not identify; never cache thresholds under it
+UNKNOWN_PLANT = "Unknown Plant"
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -22,9 +27,11 @@ class PlantMonitor:
     def __init__(self, user_data_folder, line_bot_api):
         self.user_data_folder = Path(user_data_folder)
         self.line_bot_api = line_bot_api
-        self.client = Groq(api_key=os.getenv('GROQ_API_KEY'))
         self.latest_readings = {}
+        self.reading_store = ReadingStore(self.user_data_folder / 'readings')
         self.reading_history = {}
+        # Not app.py's cache: these thresholds include light, so the two must not share entries
+        self.threshold_cache = ThresholdCache(self.user_data_folder / 'monitor_threshold_cache.sqlite3')
         self.connected = False
 
     async def find_arduino(self):
@@ -37,24 +44,31 @@ class PlantMonitor:
 
     def get_thresholds_from_llm(self, plant_name):
         """Get plant care thresholds from LLM based on scientific name"""
+        cacheable = plant_name != UNKNOWN_PLANT
+        thresholds = self.threshold_cache.get(plant_name) if cacheable else None
+        if thresholds:
+            return thresholds
+
         prompt = (
             f"As a plant expert, provide the ideal growing conditions for {plant_name} in this exact format:\n"
             f"temperature_min\ttemperature_max\thumidity_min\thumidity_max\tlight_min\tlight_max\tmoisture_min\tmoisture_max\n"
             f"Only respond with tab-separated values in Celsius for temperature, percentage for others. No explanations."
         )
 
-        response = self.client.chat.completions.create(
-            messages=[{"role": "user", "content": prompt}],
-            model="llama3-8b-8192"
-        )
-
-        values = response.choices[0].message.content.strip().split('\t')
-        return {
-            'temperature': {'min': float(values[0]), 'max': float(values[1])},
-            'humidity': {'min': float(values[2]), 'max': float(values[3])},
-            'light': {'min': float(values[4]), 'max': float(values[5])},
-            'moisture': {'min': float(values[6]), 'max': float(values[7])}
-        }
+        thresholds = parse_thresholds(chat_completion(prompt), THRESHOLD_METRICS)
+        if cacheable:
+            self.threshold_cache.set(plant_name, thresholds)
+        return thresholds
+
+    def get_reading_history(self, user_id, frequency_minutes=1):
+        """Get the in-memory reading history of a user, loading it on first use"""
+        history = self.reading_history.get(user_id)
+        if history is None:
+            history = ReadingHistory.for_frequency(frequency_minutes)
+            start = datetime.now().timestamp() - history.retention_seconds
+            history.extend(self.reading_store.read_range(user_id, start=start))
+            self.reading_history[user_id] = history
+        return history
 
     def update_plant_data(self, user_id, current_reading):
         """Update plant data with new sensor readings"""
@@ -66,27 +80,18 @@ class PlantMonitor:
             with open(file_path, 'r+') as f:
                 data = json.load(f)
 
-                # Initialize history if not present
-                if 'reading_history' not in data:
-                    data['reading_history'] = []
+                # Legacy files keep their history inline; move it to the reading log once
+                if 'reading_history' in data:
+                    self.reading_store.import_history(user_id, data.pop('reading_history'))
 
-                # Add timestamp to current reading
-                current_reading['timestamp'] = datetime.now().isoformat()
-
-                # Add new reading
-                data['reading_history'].append(current_reading)
-
-                # Remove readings older than 1 week
-                week_ago = datetime.now() - timedelta(days=7)
-                data['reading_history'] = [
-                    reading for reading in data['reading_history']
-                    if datetime.fromisoformat(reading['timestamp']) > week_ago
-                ]
+                # Append the new reading to the log instead of rewriting the history
+                current_reading = self.reading_store.append(user_id, current_reading)
+                self.get_reading_history(user_id).append(current_reading['ts'], current_reading)
 
                 # Update latest reading
                 data['latest_reading'] = current_reading
 
-                # Reset file pointer and write updated data
+                # Reset file pointer and write updated data (metadata only)
                 f.seek(0)
                 json.dump(data, f, indent=4)
                 f.truncate()
@@ -94,6 +99,9 @@ class PlantMonitor:
                 # Check thresholds and send notification if needed
                 self.check_thresholds(user_id, current_reading, data['thresholds'])
 
+        except Exception as e:
+            logger.error(f"Error updating plant data: {e}")
+
     def check_thresholds(self, user_id, reading, thresholds):
         """Check if readings are outside thresholds and notify user"""
         alerts = []
@@ -117,12 +125,7 @@ class PlantMonitor:
             f"Make it sound caring but emphasize the importance of addressing these issues."
         )
 
-        response = self.client.chat.completions.create(
-            messages=[{"role": "user", "content": prompt}],
-            model="llama3-8b-8192"
-        )
-
-        alert_message = response.choices[0].message.content
+        alert_message = chat_completion(prompt)
 
         # Send message using LINE Bot API
         from linebot.v3.messaging import TextMessage
@@ -151,12 +154,7 @@ class PlantMonitor:
                 f"Include both the current status and any care suggestions if needed."
             )
 
-            response = self.client.chat.completions.create(
-                messages=[{"role": "user", "content": prompt}],
-                model="llama3-8b-8192"
-            )
-
-            return response.choices[0].message.content
+            return chat_completion(prompt)
 
         except Exception as e:
             logger.error(f"Error getting status: {str(e)}")
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import logging
+from pathlib import Path
+
+try:
+    from PIL import Image
+except ImportError:
+    # Without Pillow only byte-identical images are matched
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(image_path):
+    """SHA-256 of the image bytes"""
+    digest = hashlib.sha256()
+    with open(image_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def perceptual_hash(image_path):
+    """64-bit difference hash (dHash) of the image, or None without Pillow"""
+    if Image is None:
+        return None
+    try:
+        with Image.open(image_path) as image:
+            pixels = list(image.convert('L').resize((9, 8)).getdata())
+    except Exception as e:
+        logger.warning(f"Could not compute perceptual hash for {image_path}: {str(e)}")
+        return None
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return bits
+
+
+class PlantIdCache:
+    """On-disk cache of parsed Plant.id results keyed by image content.
+
+    Each endpoint gets a folder of '<sha256>.json' files. A lookup first
+    tries the exact content hash. For the endpoints in near_match, and
+    when Pillow is available, it then tries any entry whose perceptual
+    hash is within max_distance bits, so a re-compressed photo is also
+    served locally. A similar photo shows the same species but not
+    necessarily the same condition, so by default only identification
+    takes near matches. The least recently used
+    entries are evicted past max_entries per endpoint. Endpoints listed in
+    max_age ({endpoint: seconds}) also expire their entries by age, for
+    results such as health assessments that go stale.
+    """
+
+    def __init__(self, folder, max_entries=500, max_distance=4, max_age=None, near_match=('identify',)):
+        self.folder = Path(folder)
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.near_match = frozenset(near_match)
+        self.max_age = dict(max_age or {})
+        self._index = {}
+        self._lock = threading.Lock()
+
+    def _endpoint_index(self, endpoint):
+        """Return {sha256: dhash} for an endpoint, loading it on first use"""
+        index = self._index.get(endpoint)
+        if index is None:
+            index = {}
+            folder = self.folder / endpoint
+            folder.mkdir(parents=True, exist_ok=True)
+            for path in folder.glob('*.json'):
+                try:
+                    with open(path, 'r') as f:
+                        index[path.stem] = json.load(f).get('dhash')
+                except (OSError, ValueError):
+                    continue
+            self._index[endpoint] = index
+        return index
+
+    def _path(self, endpoint, key):
+        return self.folder / endpoint / f'{key}.json'
+
+    def get(self, endpoint, image_path):
+        """Return (key, cached value); value is None on a miss.
+
+        Pass key on to set() so the image is not hashed again.
+        """
+        sha = content_hash(image_path)
+        with self._lock:
+            exact = sha in self._endpoint_index(endpoint)
+
+        # Decoding the photo takes long; other lookups must not wait on it
+        dhash = None
+        if not exact and endpoint in self.near_match and Image is not None:
+            dhash = perceptual_hash(image_path)
+        key = (sha, dhash)
+
+        with self._lock:
+            index = self._endpoint_index(endpoint)
+            match = sha if sha in index else None
+            if match is None and index and dhash is not None:
+                distance, match = min(
+                    ((bin(dhash ^ other).count('1'), other_key)
+                     for other_key, other in index.items() if other is not None),
+                    default=(None, None)
+                )
+                if distance is None or distance > self.max_distance:
+                    match = None
+            if match is None:
+                return key, None
+
+            path = self._path(endpoint, match)
+            try:
+                with open(path, 'r') as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                index.pop(match, None)
+                return key, None
+
+            max_age = self.max_age.get(endpoint)
+            if max_age is not None and time.time() - entry.get('created', 0) > max_age:
+                path.unlink(missing_ok=True)
+                index.pop(match, None)
+                return key, None
+            os.utime(path)
+
+        logger.info(f"Plant.id {endpoint} cache hit for {image_path}")
+        return key, entry['value']
+
+    def set(self, endpoint, image_path, value, key=None):
+        """Store a parsed result for an image and evict old entries"""
+        sha, dhash = key or (content_hash(image_path), None)
+        if dhash is None and endpoint in self.near_match and Image is not None:
+            dhash = perceptual_hash(image_path)
+        entry = {'value': value, 'dhash': dhash, 'created': time.time()}
+        key = sha
+        with self._lock:
+            index = self._endpoint_index(endpoint)
+            path = self._path(endpoint, key)
+            tmp_path = path.with_suffix('.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, path)
+            index[key] = entry['dhash']
+
+            if len(index) > self.max_entries:
+                paths = sorted((self.folder / endpoint).glob('*.json'), key=lambda p: p.stat().st_mtime)
+                for old_path in paths[:len(paths) - self.max_entries]:
+                    old_path.unlink(missing_ok=True)
+                    index.pop(old_path.stem, None)
@@ -0,0 +1,111 @@
+import os
+import signal
+import sys
+import threading
+import time
+import logging
+from collections import Counter
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+
+class SamplingProfiler:
+    """Statistical profiler that samples the stacks of all threads.
+
+    While running, a background thread records every thread's stack each
+    interval seconds. Stacks are prefixed with the span the thread is in,
+    so slow stages of traced requests stand out. The result is in the
+    collapsed-stack format ('frame;frame;frame count') that flame graph
+    tools read. Nothing is sampled while the profiler is stopped.
+    """
+
+    def __init__(self, interval=0.005, max_depth=40):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = Counter()
+        self.started_at = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.samples = Counter()
+            self.started_at = time.time()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+            self._thread.start()
+        logger.info(f"Sampling profiler started ({self.interval * 1000:g} ms interval)")
+
+    def stop(self):
+        """Stop sampling and return the collected samples"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return self.samples
+        self._stop.set()
+        thread.join()
+        logger.info(f"Sampling profiler stopped after {sum(self.samples.values())} samples")
+        return self.samples
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                span = tracing.active_spans.get(thread_id)
+                if span:
+                    stack.append(f'span:{span}')
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.samples.most_common())
+
+    def write(self, folder):
+        """Write the collapsed stacks to folder; returns the file path"""
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f'profile-{time.strftime("%Y%m%d-%H%M%S")}.txt')
+        with open(path, 'w') as f:
+            f.write(self.collapsed())
+        return path
+
+
+def install_toggle(profiler, folder, signum=getattr(signal, 'SIGUSR2', None)):
+    """Toggle the profiler with a signal; stopping writes the profile to folder.
+
+    Must be called from the main thread. Does nothing on platforms without
+    the signal.
+    """
+    if signum is None:
+        return False
+
+    def toggle(signum, frame):
+        if not profiler.running:
+            profiler.start()
+            return
+
+        # Joining and writing happen off the signal handler
+        def finish():
+            profiler.stop()
+            logger.info(f"Profile written to {profiler.write(folder)}")
+
+        threading.Thread(target=finish, name='profiler-writer', daemon=True).start()
+
+    signal.signal(signum, toggle)
+    return True
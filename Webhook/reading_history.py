@@ -0,0 +1,100 @@
+import math
+
+import numpy as np
+
+# Metrics reported by the Arduino sensor
+METRICS = ('temperature', 'humidity', 'moisture')
+
+DEFAULT_RETENTION_SECONDS = 7 * 24 * 3600
+
+
+class ReadingHistory:
+    """Fixed-capacity ring buffer of readings held in parallel NumPy arrays.
+
+    Timestamps are epoch seconds (float64) and metric values float32, with
+    NaN marking a metric that was missing from a reading. Appends and
+    evictions only move the ring's start/count, so both are O(1).
+    """
+
+    def __init__(self, capacity, retention_seconds=DEFAULT_RETENTION_SECONDS, metrics=METRICS):
+        self.capacity = int(capacity)
+        self.retention_seconds = retention_seconds
+        self.metrics = tuple(metrics)
+        self._index = {metric: i for i, metric in enumerate(self.metrics)}
+        self._ts = np.full(self.capacity, np.nan, dtype=np.float64)
+        self._values = np.full((len(self.metrics), self.capacity), np.nan, dtype=np.float32)
+        self._start = 0
+        self._count = 0
+
+    @classmethod
+    def for_frequency(cls, frequency_minutes, retention_seconds=DEFAULT_RETENTION_SECONDS, **kwargs):
+        """Size the buffer for one reading every frequency_minutes"""
+        capacity = math.ceil(retention_seconds / (max(frequency_minutes, 1 / 60) * 60)) + 1
+        return cls(capacity, retention_seconds=retention_seconds, **kwargs)
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def nbytes(self):
+        return self._ts.nbytes + self._values.nbytes
+
+    def append(self, ts, reading):
+        """Add one reading (a dict of metric values) taken at epoch ts"""
+        if self._count == self.capacity:
+            # Full: overwrite the oldest slot
+            self._start = (self._start + 1) % self.capacity
+            self._count -= 1
+
+        slot = (self._start + self._count) % self.capacity
+        self._ts[slot] = ts
+        column = self._values[:, slot]
+        column[:] = np.nan
+        for metric, value in reading.items():
+            i = self._index.get(metric)
+            if i is not None and isinstance(value, (int, float)):
+                column[i] = value
+        self._count += 1
+
+        self.evict(ts - self.retention_seconds)
+
+    def extend(self, records):
+        """Append records carrying an epoch 'ts' field, oldest first"""
+        for record in records:
+            self.append(record['ts'], record)
+
+    def evict(self, cutoff):
+        """Drop readings older than cutoff; amortized O(1) per reading"""
+        while self._count and self._ts[self._start] < cutoff:
+            self._start = (self._start + 1) % self.capacity
+            self._count -= 1
+
+    def _ordered(self):
+        """Return (ts, values) in time order, as views when not wrapped"""
+        end = self._start + self._count
+        if end <= self.capacity:
+            return self._ts[self._start:end], self._values[:, self._start:end]
+        tail = end - self.capacity
+        return (
+            np.concatenate((self._ts[self._start:], self._ts[:tail])),
+            np.concatenate((self._values[:, self._start:], self._values[:, :tail]), axis=1),
+        )
+
+    def window(self, start=None, end=None):
+        """Return (timestamps, {metric: values}) for start <= ts < end"""
+        ts, values = self._ordered()
+        lo = 0 if start is None else np.searchsorted(ts, start, side='left')
+        hi = len(ts) if end is None else np.searchsorted(ts, end, side='left')
+        return ts[lo:hi], {metric: values[i, lo:hi] for metric, i in self._index.items()}
+
+    def latest(self):
+        """Return the newest reading as a dict, or None"""
+        if not self._count:
+            return None
+        slot = (self._start + self._count - 1) % self.capacity
+        reading = {'ts': float(self._ts[slot])}
+        for metric, i in self._index.items():
+            value = self._values[i, slot]
+            if not np.isnan(value):
+                reading[metric] = float(value)
+        return reading
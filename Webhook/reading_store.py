@@ -0,0 +1,149 @@
+import json
+import os
+import threading
+import time
+import logging
+from datetime import datetime
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Readings are kept for one week, in one segment file per day
+DEFAULT_RETENTION_SECONDS = 7 * 24 * 3600
+DEFAULT_SEGMENT_SECONDS = 24 * 3600
+
+
+class ReadingStore:
+    """Append-only, segmented log of sensor readings, one directory per user.
+
+    Every reading is appended as one JSON line to the segment covering its
+    timestamp, so ingest never touches older data. Segment files are named
+    after the epoch second they start at, which lets retention drop whole
+    files and range reads open only the segments that overlap the range.
+    """
+
+    def __init__(self, root_folder, retention_seconds=DEFAULT_RETENTION_SECONDS,
+                 segment_seconds=DEFAULT_SEGMENT_SECONDS):
+        self.root_folder = Path(root_folder)
+        self.retention_seconds = retention_seconds
+        self.segment_seconds = segment_seconds
+        self.root_folder.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._current_segment = {}
+
+    def _user_folder(self, user_id):
+        return self.root_folder / str(user_id)
+
+    def _segment_start(self, ts):
+        return int(ts // self.segment_seconds) * self.segment_seconds
+
+    def _segments(self, user_id):
+        """Return (start, path) for every segment of a user, oldest first"""
+        folder = self._user_folder(user_id)
+        if not folder.exists():
+            return []
+        segments = []
+        for path in folder.glob('*.jsonl'):
+            try:
+                segments.append((int(path.stem), path))
+            except ValueError:
+                continue
+        segments.sort()
+        return segments
+
+    def append(self, user_id, reading, ts=None):
+        """Append one reading; returns the stored record"""
+        ts = time.time() if ts is None else ts
+        record = dict(reading)
+        record['ts'] = ts
+        record.setdefault('timestamp', datetime.fromtimestamp(ts).isoformat())
+        segment_start = self._segment_start(ts)
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+
+        with self._lock:
+            folder = self._user_folder(user_id)
+            if self._current_segment.get(user_id) != segment_start:
+                # First write into a new segment: this is the only time
+                # retention has to run for this user
+                folder.mkdir(parents=True, exist_ok=True)
+                self._current_segment[user_id] = segment_start
+                self._expire_locked(user_id, ts)
+
+            with open(folder / f'{segment_start}.jsonl', 'a') as f:
+                f.write(line)
+
+        return record
+
+    def _expire_locked(self, user_id, now):
+        cutoff = now - self.retention_seconds
+        for start, path in self._segments(user_id):
+            # A segment may only go once its newest possible reading is too old
+            if start + self.segment_seconds > cutoff:
+                break
+            try:
+                path.unlink()
+                logger.debug(f"Dropped expired segment {path}")
+            except FileNotFoundError:
+                pass
+
+    def expire(self, user_id, now=None):
+        """Drop every segment that lies entirely outside the retention window"""
+        with self._lock:
+            self._expire_locked(user_id, time.time() if now is None else now)
+
+    def read_range(self, user_id, start=None, end=None):
+        """Yield readings with start <= ts < end, oldest first"""
+        start = float('-inf') if start is None else start
+        end = float('inf') if end is None else end
+
+        for segment_start, path in self._segments(user_id):
+            if segment_start >= end or segment_start + self.segment_seconds <= start:
+                continue
+            # Only segments straddling a boundary need a per-record check
+            whole = segment_start >= start and segment_start + self.segment_seconds <= end
+            try:
+                with open(path, 'r') as f:
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            # A torn last line from a crash mid-append
+                            continue
+                        if whole or start <= record['ts'] < end:
+                            yield record
+            except FileNotFoundError:
+                continue
+
+    def latest(self, user_id):
+        """Return the newest reading of a user, or None"""
+        for _, path in reversed(self._segments(user_id)):
+            try:
+                with open(path, 'rb') as f:
+                    lines = f.read().splitlines()
+            except FileNotFoundError:
+                continue
+            for line in reversed(lines):
+                try:
+                    return json.loads(line)
+                except ValueError:
+                    continue
+        return None
+
+    def import_history(self, user_id, history):
+        """Move a legacy JSON reading_history list into the log"""
+        for reading in history:
+            try:
+                ts = datetime.fromisoformat(reading['timestamp']).timestamp()
+            except (KeyError, TypeError, ValueError):
+                continue
+            self.append(user_id, reading, ts=ts)
+
+    def delete_user(self, user_id):
+        """Remove every segment of a user"""
+        with self._lock:
+            for _, path in self._segments(user_id):
+                path.unlink(missing_ok=True)
+            self._current_segment.pop(user_id, None)
+            folder = self._user_folder(user_id)
+            if folder.exists() and not os.listdir(folder):
+                folder.rmdir()
@@ -0,0 +1,209 @@
+import sqlite3
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+# Buckets are kept much longer than the 7 days of raw readings
+DEFAULT_RETENTION = {
+    'hour': 90 * DAY,
+    'day': 5 * 365 * DAY,
+}
+
+
+def bucket_start(tier, ts):
+    """Start of the hour or local calendar day holding ts"""
+    if tier == 'hour':
+        return int(ts // HOUR * HOUR)
+    day = datetime.fromtimestamp(ts).replace(hour=0, minute=0, second=0, microsecond=0)
+    return int(day.timestamp())
+
+
+def _next_day(ts):
+    # Calendar arithmetic keeps days aligned across DST changes
+    return int((datetime.fromtimestamp(ts) + timedelta(days=1)).replace(hour=0).timestamp())
+
+
+class RollupStore:
+    """Hourly and daily min/max/mean per plant and metric, updated as readings arrive.
+
+    Every reading is folded into its hour and day bucket with one upsert
+    per tier and metric, so queries never scan raw readings. Readings
+    carrying interval stats (min, max, mean and count of the samples behind
+    them) are folded in exactly. Readings at or before the newest one seen
+    for a user are ignored, so replaying a reading log is safe.
+    """
+
+    def __init__(self, db_path, metrics, retention=None, purge_interval=HOUR):
+        self.db_path = str(db_path)
+        self.metrics = tuple(metrics)
+        self.retention = dict(DEFAULT_RETENTION, **(retention or {}))
+        self.purge_interval = purge_interval
+        self._last_purge = 0
+        self._latest = {}
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rollups ("
+                "user_id TEXT NOT NULL, tier TEXT NOT NULL, bucket INTEGER NOT NULL, metric TEXT NOT NULL, "
+                "count INTEGER NOT NULL, total REAL NOT NULL, min REAL NOT NULL, max REAL NOT NULL, "
+                "PRIMARY KEY (user_id, tier, bucket, metric))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rollup_progress ("
+                "user_id TEXT PRIMARY KEY, latest_ts REAL NOT NULL)"
+            )
+            self._latest = dict(conn.execute("SELECT user_id, latest_ts FROM rollup_progress"))
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def latest_ts(self, user_id):
+        """Timestamp of the newest reading folded in for a plant, or None"""
+        return self._latest.get(user_id)
+
+    def _rows(self, user_id, reading):
+        ts = reading['ts']
+        stats = reading.get('stats') or {}
+        buckets = {tier: bucket_start(tier, ts) for tier in self.retention}
+        for metric in self.metrics:
+            metric_stats = stats.get(metric)
+            if metric_stats and metric_stats.get('count'):
+                count = metric_stats['count']
+                total = metric_stats['mean'] * count
+                low, high = metric_stats['min'], metric_stats['max']
+            else:
+                value = reading.get(metric)
+                if not isinstance(value, (int, float)):
+                    continue
+                count, total, low, high = 1, value, value, value
+            for tier, bucket in buckets.items():
+                yield user_id, tier, bucket, metric, count, total, low, high
+
+    def add_many(self, readings):
+        """Fold (user_id, reading) pairs into their buckets in one transaction"""
+        rows = []
+        latest = {}
+        with self._lock:
+            for user_id, reading in readings:
+                ts = reading['ts']
+                if ts <= max(self._latest.get(user_id, float('-inf')), latest.get(user_id, float('-inf'))):
+                    continue
+                latest[user_id] = ts
+                rows.extend(self._rows(user_id, reading))
+            if not latest:
+                return 0
+
+            with self._connect() as conn:
+                conn.executemany(
+                    "INSERT INTO rollups (user_id, tier, bucket, metric, count, total, min, max) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (user_id, tier, bucket, metric) DO UPDATE SET "
+                    "count = count + excluded.count, total = total + excluded.total, "
+                    "min = min(min, excluded.min), max = max(max, excluded.max)",
+                    rows
+                )
+                conn.executemany(
+                    "INSERT OR REPLACE INTO rollup_progress (user_id, latest_ts) VALUES (?, ?)",
+                    latest.items()
+                )
+            self._latest.update(latest)
+
+        if time.time() - self._last_purge >= self.purge_interval:
+            self.purge()
+        return len(latest)
+
+    def add(self, user_id, reading):
+        return self.add_many([(user_id, reading)])
+
+    def purge(self, now=None):
+        """Drop buckets past their tier's retention"""
+        now = time.time() if now is None else now
+        self._last_purge = now
+        with self._connect() as conn:
+            for tier, retention in self.retention.items():
+                conn.execute("DELETE FROM rollups WHERE tier = ? AND bucket < ?", (tier, now - retention))
+
+    def delete_user(self, user_id):
+        with self._lock:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM rollups WHERE user_id = ?", (user_id,))
+                conn.execute("DELETE FROM rollup_progress WHERE user_id = ?", (user_id,))
+            self._latest.pop(user_id, None)
+
+    def query(self, user_id, start, end, tier='hour'):
+        """Buckets of one tier starting in [start, end), oldest first.
+
+        Returns a list of {'start': bucket start, metric: {'min', 'max',
+        'mean', 'count'}}.
+        """
+        if tier not in self.retention:
+            raise ValueError(f"Unknown rollup tier: {tier}")
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT bucket, metric, count, total, min, max FROM rollups "
+                "WHERE user_id = ? AND tier = ? AND bucket >= ? AND bucket < ? ORDER BY bucket",
+                (user_id, tier, int(start), int(end))
+            ).fetchall()
+
+        buckets = {}
+        for bucket, metric, count, total, low, high in rows:
+            entry = buckets.setdefault(bucket, {'start': bucket})
+            entry[metric] = {'min': low, 'max': high, 'mean': total / count, 'count': count}
+        return list(buckets.values())
+
+    def summary(self, user_id, start, end):
+        """Per-metric min/max/mean/count over [start, end), widened to whole hours.
+
+        Whole days inside the range come from the daily tier and the
+        partial days at either end from the hourly tier, so at most a few
+        dozen rows are read whatever the range or reading rate.
+        """
+        first_day = bucket_start('day', start)
+        if first_day < start:
+            first_day = _next_day(first_day)
+        last_day = bucket_start('day', end)
+
+        parts = []
+        if first_day < last_day:
+            parts.append(('day', first_day, last_day))
+            parts.append(('hour', start, first_day))
+            parts.append(('hour', last_day, end))
+        else:
+            parts.append(('hour', start, end))
+
+        totals = {}
+        with self._connect() as conn:
+            for tier, part_start, part_end in parts:
+                if part_start >= part_end:
+                    continue
+                rows = conn.execute(
+                    "SELECT metric, sum(count), sum(total), min(min), max(max) FROM rollups "
+                    "WHERE user_id = ? AND tier = ? AND bucket >= ? AND bucket < ? GROUP BY metric",
+                    (user_id, tier, int(bucket_start('hour', part_start)), int(part_end))
+                ).fetchall()
+                for metric, count, total, low, high in rows:
+                    entry = totals.setdefault(metric, [0, 0.0, low, high])
+                    entry[0] += count
+                    entry[1] += total
+                    entry[2] = min(entry[2], low)
+                    entry[3] = max(entry[3], high)
+
+        return {
+            metric: {'min': low, 'max': high, 'mean': total / count, 'count': count}
+            for metric, (count, total, low, high) in totals.items() if count
+        }
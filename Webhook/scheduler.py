@@ -0,0 +1,80 @@
+import heapq
+import itertools
+import threading
+import time
+
+MIN_INTERVAL_SECONDS = 1
+
+
+class DueScheduler:
+    """Min-heap of plants keyed by the time their next update is due.
+
+    Every plant has its own interval in seconds (sub-minute intervals are
+    fine). Rescheduling or removing a plant leaves its old heap entry in
+    place and marks it stale, so both are O(log n). on_change, if set, is
+    called whenever the earliest due time may have moved earlier.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._entries = {}
+        self._versions = itertools.count()
+        self._lock = threading.Lock()
+        self.on_change = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, plant_id):
+        return plant_id in self._entries
+
+    def schedule(self, plant_id, interval_seconds, next_due=None):
+        """(Re)schedule a plant; the first update is due at next_due or one interval from now"""
+        interval_seconds = max(interval_seconds, MIN_INTERVAL_SECONDS)
+        next_due = time.time() + interval_seconds if next_due is None else next_due
+        with self._lock:
+            version = next(self._versions)
+            self._entries[plant_id] = (version, interval_seconds)
+            heapq.heappush(self._heap, (next_due, version, plant_id))
+            earliest = self._heap[0][1] == version
+        if earliest and self.on_change:
+            self.on_change()
+
+    def remove(self, plant_id):
+        with self._lock:
+            self._entries.pop(plant_id, None)
+
+    def _drop_stale(self):
+        while self._heap:
+            _, version, plant_id = self._heap[0]
+            entry = self._entries.get(plant_id)
+            if entry is not None and entry[0] == version:
+                return
+            heapq.heappop(self._heap)
+
+    def seconds_until_due(self, now=None):
+        """Seconds until the next plant is due (0 if overdue), or None if empty"""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._drop_stale()
+            if not self._heap:
+                return None
+            return max(0.0, self._heap[0][0] - now)
+
+    def pop_due(self, now=None):
+        """Return the plants due by now and schedule their next update"""
+        now = time.time() if now is None else now
+        due = []
+        with self._lock:
+            self._drop_stale()
+            while self._heap and self._heap[0][0] <= now:
+                due_at, version, plant_id = heapq.heappop(self._heap)
+                interval = self._entries[plant_id][1]
+                next_due = due_at + interval
+                if next_due <= now:
+                    # Skip missed slots instead of replaying them
+                    next_due = now + interval
+                heapq.heappush(self._heap, (next_due, version, plant_id))
+                due.append(plant_id)
+                self._drop_stale()
+        return due
@@ -0,0 +1,68 @@
+import threading
+
+import numpy as np
+
+
+class SampleAggregator:
+    """Per-interval min/max/mean/count of a device's sensor samples.
+
+    Samples land in a preallocated ring per metric. When a ring fills up it
+    is folded into running totals in one vectorized step, so each sample
+    costs O(1) and memory stays bounded however fast the firmware reports.
+    emit() returns the statistics of everything since the previous emit().
+    """
+
+    def __init__(self, metrics, capacity=256):
+        self.metrics = tuple(metrics)
+        self.capacity = capacity
+        self._index = {metric: i for i, metric in enumerate(self.metrics)}
+        self._samples = np.empty((len(self.metrics), capacity), dtype=np.float64)
+        self._fill = [0] * len(self.metrics)
+        self._lock = threading.Lock()
+        self._reset_totals()
+
+    def _reset_totals(self):
+        n = len(self.metrics)
+        self._min = np.full(n, np.inf)
+        self._max = np.full(n, -np.inf)
+        self._sum = np.zeros(n)
+        self._count = np.zeros(n, dtype=np.int64)
+
+    def add(self, metric, value):
+        """Record one decoded sample"""
+        i = self._index[metric]
+        with self._lock:
+            fill = self._fill[i]
+            self._samples[i, fill] = value
+            fill += 1
+            if fill == self.capacity:
+                self._fold(i, fill)
+                fill = 0
+            self._fill[i] = fill
+
+    def _fold(self, i, fill):
+        samples = self._samples[i, :fill]
+        self._min[i] = min(self._min[i], samples.min())
+        self._max[i] = max(self._max[i], samples.max())
+        self._sum[i] += samples.sum()
+        self._count[i] += fill
+
+    def emit(self):
+        """Return {metric: {'min', 'max', 'mean', 'count'}} and start a new interval"""
+        with self._lock:
+            for i, fill in enumerate(self._fill):
+                if fill:
+                    self._fold(i, fill)
+                    self._fill[i] = 0
+            stats = {}
+            for metric, i in self._index.items():
+                count = int(self._count[i])
+                if count:
+                    stats[metric] = {
+                        'min': float(self._min[i]),
+                        'max': float(self._max[i]),
+                        'mean': float(self._sum[i] / count),
+                        'count': count
+                    }
+            self._reset_totals()
+        return stats
@@ -0,0 +1,151 @@
+import abc
+import json
+import sqlite3
+import threading
+import time
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_SECONDS = 30 * 60
+
+
+class SessionStore(abc.ABC):
+    """Conversation state per user, expiring after ttl_seconds of inactivity.
+
+    Values are plain JSON-serializable dicts. get() returns a copy, so
+    changes must be written back with set(). Reading a session extends it.
+    """
+
+    def __init__(self, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+
+    @abc.abstractmethod
+    def get(self, user_id):
+        """Return a copy of a user's session, or {} if there is none"""
+
+    @abc.abstractmethod
+    def set(self, user_id, session):
+        """Replace a user's session"""
+
+    @abc.abstractmethod
+    def delete(self, user_id):
+        """Drop a user's session"""
+
+    def update(self, user_id, **changes):
+        """Merge changes into a user's session and return it"""
+        session = self.get(user_id)
+        session.update(changes)
+        self.set(user_id, session)
+        return session
+
+
+class MemorySessionStore(SessionStore):
+    """In-process sessions with LRU eviction past max_entries"""
+
+    def __init__(self, ttl_seconds=DEFAULT_TTL_SECONDS, max_entries=10000):
+        super().__init__(ttl_seconds)
+        self.max_entries = max_entries
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        now = time.time()
+        with self._lock:
+            entry = self._sessions.get(user_id)
+            if entry is None:
+                return {}
+            if entry[0] <= now:
+                del self._sessions[user_id]
+                return {}
+            # Activity extends the session
+            self._sessions[user_id] = (now + self.ttl_seconds, entry[1])
+            self._sessions.move_to_end(user_id)
+        return json.loads(entry[1])
+
+    def set(self, user_id, session):
+        now = time.time()
+        with self._lock:
+            self._sessions[user_id] = (now + self.ttl_seconds, json.dumps(session))
+            self._sessions.move_to_end(user_id)
+            # Expired sessions sit at the front, followed by the least recently used
+            while self._sessions:
+                oldest_id, (expires, value) = next(iter(self._sessions.items()))
+                if expires > now and len(self._sessions) <= self.max_entries:
+                    break
+                del self._sessions[oldest_id]
+
+    def delete(self, user_id):
+        with self._lock:
+            self._sessions.pop(user_id, None)
+
+
+class SQLiteSessionStore(SessionStore):
+    """Sessions in a SQLite file shared by every worker process on the host"""
+
+    def __init__(self, db_path, ttl_seconds=DEFAULT_TTL_SECONDS, purge_interval=60):
+        super().__init__(ttl_seconds)
+        self.db_path = str(db_path)
+        self.purge_interval = purge_interval
+        self._last_purge = 0
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "user_id TEXT PRIMARY KEY, session TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, user_id):
+        now = time.time()
+        with self._connect() as conn:
+            # Activity extends the session, as with MemorySessionStore
+            conn.execute(
+                "UPDATE sessions SET expires = ? WHERE user_id = ? AND expires > ?",
+                (now + self.ttl_seconds, user_id, now)
+            )
+            row = conn.execute(
+                "SELECT session FROM sessions WHERE user_id = ? AND expires > ?", (user_id, now)
+            ).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def set(self, user_id, session):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (user_id, session, expires) VALUES (?, ?, ?)",
+                (user_id, json.dumps(session), now + self.ttl_seconds)
+            )
+        if now - self._last_purge >= self.purge_interval:
+            self.purge()
+
+    def delete(self, user_id):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+
+    def purge(self):
+        """Delete expired sessions"""
+        now = time.time()
+        self._last_purge = now
+        with self._connect() as conn:
+            conn.execute("DELETE FROM sessions WHERE expires <= ?", (now,))
+
+
+def create_session_store(url, **kwargs):
+    """Build a store from a URL: 'memory' or 'sqlite:///path/to/sessions.sqlite3'"""
+    if not url or url == 'memory':
+        return MemorySessionStore(**kwargs)
+    if url.startswith('sqlite:///'):
+        return SQLiteSessionStore(url[len('sqlite:///'):], **kwargs)
+    raise ValueError(f"Unsupported session store: {url}")
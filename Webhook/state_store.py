@@ -0,0 +1,94 @@
+import threading
+import logging
+from types import MappingProxyType
+
+logger = logging.getLogger(__name__)
+
+
+class PlantSnapshot:
+    """Immutable view of one plant's state at a given version"""
+
+    __slots__ = ('plant_id', 'version', 'data')
+
+    def __init__(self, plant_id, version, data):
+        self.plant_id = plant_id
+        self.version = version
+        self.data = MappingProxyType(data)
+
+    def to_dict(self):
+        return dict(self.data)
+
+
+class PlantStateStore:
+    """Process-wide store of plant state as copy-on-write snapshots.
+
+    Writers build a new snapshot with a bumped version and swap it in under
+    a lock. Readers only fetch the current snapshot reference, which is a
+    single dict lookup and never blocks on writers. Subscribers are called
+    with (plant_id, snapshot) after every change, or snapshot None on removal.
+    """
+
+    def __init__(self):
+        self._snapshots = {}
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def __contains__(self, plant_id):
+        return plant_id in self._snapshots
+
+    def __len__(self):
+        return len(self._snapshots)
+
+    def get(self, plant_id):
+        """Return the current snapshot of a plant, or None"""
+        return self._snapshots.get(plant_id)
+
+    def snapshots(self):
+        """Return a consistent copy of {plant_id: snapshot}"""
+        return dict(self._snapshots)
+
+    def put(self, plant_id, data):
+        """Replace a plant's state; returns the new snapshot"""
+        with self._lock:
+            current = self._snapshots.get(plant_id)
+            snapshot = PlantSnapshot(plant_id, current.version + 1 if current else 1, dict(data))
+            self._snapshots[plant_id] = snapshot
+        self._notify(plant_id, snapshot)
+        return snapshot
+
+    def update(self, plant_id, **changes):
+        """Copy a plant's state with some keys changed; returns the new snapshot"""
+        with self._lock:
+            current = self._snapshots.get(plant_id)
+            if current is None:
+                raise KeyError(plant_id)
+            data = dict(current.data)
+            data.update(changes)
+            snapshot = PlantSnapshot(plant_id, current.version + 1, data)
+            self._snapshots[plant_id] = snapshot
+        self._notify(plant_id, snapshot)
+        return snapshot
+
+    def remove(self, plant_id):
+        with self._lock:
+            removed = self._snapshots.pop(plant_id, None)
+        if removed is not None:
+            self._notify(plant_id, None)
+
+    def subscribe(self, callback):
+        """Call callback(plant_id, snapshot) on every change; returns an unsubscribe function"""
+        with self._lock:
+            self._subscribers = self._subscribers + [callback]
+
+        def unsubscribe():
+            with self._lock:
+                self._subscribers = [s for s in self._subscribers if s is not callback]
+
+        return unsubscribe
+
+    def _notify(self, plant_id, snapshot):
+        for callback in self._subscribers:
+            try:
+                callback(plant_id, snapshot)
+            except Exception as e:
+                logger.error(f"State subscriber failed for {plant_id}: {str(e)}")
@@ -0,0 +1,84 @@
+import threading
+import logging
+from concurrent.futures import Future, wait
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+
+class TaskGraph:
+    """Run dependent blocking calls on an executor as soon as their inputs are ready.
+
+    Each task is called as func(*args, *results of its dependencies).
+    Independent tasks run in parallel, so the whole graph takes as long as
+    its longest chain rather than the sum of its calls. A task whose
+    dependency failed fails with the same exception without running.
+    Tasks must be added after the tasks they depend on.
+    """
+
+    def __init__(self, executor):
+        self.executor = executor
+        self.futures = {}
+
+    def add(self, name, func, *args, after=(), on_done=None):
+        """Schedule func; on_done(result) runs in the worker before dependents start"""
+        dependencies = [self.futures[dependency] for dependency in after]
+        future = Future()
+        self.futures[name] = future
+        # Runs in whatever thread completes the last dependency
+        task = tracing.continue_trace(func, name)
+
+        def run():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                result = task(*args, *(dependency.result() for dependency in dependencies))
+                if on_done is not None:
+                    try:
+                        on_done(result)
+                    except Exception as e:
+                        logger.error(f"Saving result of {name} failed: {str(e)}")
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+        def start():
+            failed = next((d for d in dependencies if d.exception() is not None), None)
+            if failed is not None:
+                if future.set_running_or_notify_cancel():
+                    future.set_exception(failed.exception())
+                return
+            self.executor.submit(run)
+
+        if not dependencies:
+            start()
+            return future
+
+        remaining = [len(dependencies)]
+        lock = threading.Lock()
+
+        def dependency_done(_):
+            with lock:
+                remaining[0] -= 1
+                ready = remaining[0] == 0
+            if ready:
+                start()
+
+        for dependency in dependencies:
+            dependency.add_done_callback(dependency_done)
+        return future
+
+    def wait(self, timeout=None):
+        """Wait for every task; returns {name: result} of the tasks that succeeded in time"""
+        wait(self.futures.values(), timeout=timeout)
+        results = {}
+        for name, future in self.futures.items():
+            if not future.done():
+                logger.warning(f"Task {name} did not finish within {timeout}s")
+            elif future.exception() is not None:
+                logger.error(f"Task {name} failed: {str(future.exception())}")
+            else:
+                results[name] = future.result()
+        return results
@@ -0,0 +1,145 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_SECONDS = 30 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 2000
+
+# Anything outside these bounds is treated as a bad LLM answer
+PLAUSIBLE_RANGES = {
+    'temperature': (-30.0, 60.0),
+}
+PERCENT_RANGE = (0.0, 100.0)
+
+# Numbers in the reply; a '-' right after a digit is a range separator, not a sign
+NUMBER_PATTERN = re.compile(r'(?<![\d.])-?\d+(?:\.\d+)?')
+RANK_WORDS = ('var', 'subsp', 'ssp', 'f')
+
+
+def normalize_species(name):
+    """Normalize a scientific name to 'genus species[ rank epithet]'"""
+    tokens = re.findall(r"[a-z×\-]+", (name or '').lower())
+    if len(tokens) > 3 and tokens[2] in RANK_WORDS:
+        return ' '.join(tokens[:2] + ['var' if tokens[2] == 'var' else 'subsp', tokens[3]])
+    return ' '.join(tokens[:2])
+
+
+def parse_thresholds(text, metrics):
+    """Parse 'min max' pairs for each metric from an LLM reply.
+
+    Raises ValueError unless the reply holds exactly one plausible min/max
+    pair per metric, in order.
+    """
+    expected = 2 * len(metrics)
+    candidates = [NUMBER_PATTERN.findall(line) for line in text.splitlines()]
+    numbers = next((found for found in candidates if len(found) == expected), None)
+    if numbers is None:
+        numbers = NUMBER_PATTERN.findall(text)
+        if len(numbers) != expected:
+            raise ValueError(f"Expected {expected} values, got {len(numbers)}: {text!r}")
+
+    thresholds = {}
+    for i, metric in enumerate(metrics):
+        low, high = float(numbers[2 * i]), float(numbers[2 * i + 1])
+        lower_bound, upper_bound = PLAUSIBLE_RANGES.get(metric, PERCENT_RANGE)
+        if not lower_bound <= low <= high <= upper_bound:
+            raise ValueError(f"Implausible {metric} range {low}-{high}")
+        thresholds[metric] = {'min': low, 'max': high}
+    return thresholds
+
+
+class ThresholdCache:
+    """Species-keyed threshold cache shared through a SQLite file.
+
+    Entries expire after ttl_seconds and the least recently used ones are
+    evicted past max_entries. A small in-process LRU sits in front so that
+    repeat lookups never touch the database.
+    """
+
+    def __init__(self, db_path, ttl_seconds=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES,
+                 memory_entries=256):
+        self.db_path = str(db_path)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS thresholds ("
+                "species TEXT PRIMARY KEY, thresholds TEXT NOT NULL, "
+                "created REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS thresholds_last_used ON thresholds (last_used)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _remember(self, species, thresholds, expires):
+        with self._lock:
+            self._memory[species] = (thresholds, expires)
+            self._memory.move_to_end(species)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, plant_name):
+        """Return cached thresholds for a species, or None"""
+        species = normalize_species(plant_name)
+        if not species:
+            return None
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(species)
+            if entry is not None:
+                if entry[1] > now:
+                    self._memory.move_to_end(species)
+                    return entry[0]
+                del self._memory[species]
+
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT thresholds, created FROM thresholds WHERE species = ?", (species,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] + self.ttl_seconds <= now:
+                conn.execute("DELETE FROM thresholds WHERE species = ?", (species,))
+                return None
+            conn.execute("UPDATE thresholds SET last_used = ? WHERE species = ?", (now, species))
+
+        thresholds = json.loads(row[0])
+        self._remember(species, thresholds, row[1] + self.ttl_seconds)
+        return thresholds
+
+    def set(self, plant_name, thresholds):
+        """Store thresholds for a species and apply TTL/LRU eviction"""
+        species = normalize_species(plant_name)
+        if not species:
+            return
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO thresholds (species, thresholds, created, last_used) VALUES (?, ?, ?, ?)",
+                (species, json.dumps(thresholds), now, now)
+            )
+            conn.execute("DELETE FROM thresholds WHERE created <= ?", (now - self.ttl_seconds,))
+            conn.execute(
+                "DELETE FROM thresholds WHERE species IN ("
+                "SELECT species FROM thresholds ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+        self._remember(species, thresholds, now + self.ttl_seconds)
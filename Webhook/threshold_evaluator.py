@@ -0,0 +1,97 @@
+import threading
+
+import numpy as np
+
+from reading_history import METRICS
+
+
+class ThresholdMatrix:
+    """Thresholds of every plant as rows of (plants x metrics) NumPy matrices.
+
+    evaluate() compares the latest readings of any number of plants against
+    their ranges in one vectorized pass, so the per-tick cost does not grow
+    with a Python loop per plant and metric.
+    """
+
+    def __init__(self, metrics=METRICS, capacity=64):
+        self.metrics = tuple(metrics)
+        self._rows = {}
+        self._plants = []
+        self._low = np.full((capacity, len(self.metrics)), -np.inf)
+        self._high = np.full((capacity, len(self.metrics)), np.inf)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._plants)
+
+    def __contains__(self, plant_id):
+        return plant_id in self._rows
+
+    def set(self, plant_id, thresholds):
+        """Add or replace a plant's {metric: {'min', 'max'}} thresholds"""
+        if not thresholds:
+            self.remove(plant_id)
+            return
+        low = [thresholds.get(m, {}).get('min', -np.inf) for m in self.metrics]
+        high = [thresholds.get(m, {}).get('max', np.inf) for m in self.metrics]
+
+        with self._lock:
+            row = self._rows.get(plant_id)
+            if row is None:
+                row = len(self._plants)
+                if row == len(self._low):
+                    self._grow()
+                self._rows[plant_id] = row
+                self._plants.append(plant_id)
+            self._low[row] = low
+            self._high[row] = high
+
+    def _grow(self):
+        extra = len(self._low)
+        self._low = np.vstack((self._low, np.full((extra, len(self.metrics)), -np.inf)))
+        self._high = np.vstack((self._high, np.full((extra, len(self.metrics)), np.inf)))
+
+    def remove(self, plant_id):
+        """Drop a plant, moving the last row into its slot"""
+        with self._lock:
+            row = self._rows.pop(plant_id, None)
+            if row is None:
+                return
+            last = len(self._plants) - 1
+            last_plant = self._plants.pop()
+            if row != last:
+                self._low[row] = self._low[last]
+                self._high[row] = self._high[last]
+                self._plants[row] = last_plant
+                self._rows[last_plant] = row
+            self._low[last] = -np.inf
+            self._high[last] = np.inf
+
+    def evaluate(self, readings):
+        """Check {plant_id: reading} against the thresholds.
+
+        Returns the set of (plant_id, metric, 'low' | 'high') breaches. Plants
+        without thresholds and metrics missing from a reading are ignored.
+        """
+        with self._lock:
+            plants = [p for p in readings if p in self._rows]
+            if not plants:
+                return set()
+            rows = np.fromiter((self._rows[p] for p in plants), dtype=np.intp, count=len(plants))
+            low = self._low[rows]
+            high = self._high[rows]
+
+        values = np.array(
+            [[_as_float(readings[p].get(m)) for m in self.metrics] for p in plants],
+            dtype=np.float64
+        )
+        # NaN compares False on both sides, so missing values never alert
+        breaches = set()
+        for condition, mask in (('low', values < low), ('high', values > high)):
+            for i, j in zip(*np.nonzero(mask)):
+                breaches.add((plants[i], self.metrics[j], condition))
+        return breaches
+
+
+def _as_float(value):
+    return float(value) if isinstance(value, (int, float)) else np.nan
@@ -0,0 +1,211 @@
+import contextvars
+import functools
+import json
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# (trace_id, span_id) of the innermost open span; None outside sampled traces
+_current = contextvars.ContextVar('trace_span', default=None)
+
+# Name of the innermost open span per thread, for the sampling profiler
+active_spans = {}
+
+
+class TraceExporter:
+    """Append finished spans as JSON lines to a file from a background thread.
+
+    Spans are written one per line as they finish, so spans of one trace
+    may be interleaved with others; group them by trace_id. When the
+    queue is full spans are dropped rather than slowing requests down.
+    The file is rotated to '<path>.1' once it grows past max_bytes.
+    """
+
+    def __init__(self, path, max_bytes=50 * 1024 * 1024, max_pending=10000):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='trace-exporter', daemon=True)
+            self._thread.start()
+
+    def export(self, span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            spans = [self._queue.get()]
+            while True:
+                try:
+                    spans.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(spans)
+            except Exception as e:
+                logger.error(f"Error writing {len(spans)} spans: {str(e)}")
+
+    def _write(self, spans):
+        try:
+            if os.path.getsize(self.path) > self.max_bytes:
+                os.replace(self.path, f'{self.path}.1')
+        except FileNotFoundError:
+            pass
+        with open(self.path, 'a') as f:
+            f.write(''.join(json.dumps(span, default=str) + '\n' for span in spans))
+
+
+class Tracer:
+    """Record spans of sampled traces and hand them to an exporter"""
+
+    def __init__(self, exporter=None, sample_rate=1.0):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+
+    @contextmanager
+    def start_trace(self, name, trace_id=None, **attributes):
+        """Open the root span of a new trace, using trace_id as its id if given"""
+        sampled = self.exporter is not None and random.random() < self.sample_rate
+        with self.resume((trace_id or uuid.uuid4().hex, None) if sampled else None, name, **attributes):
+            yield current_trace_id()
+
+    @contextmanager
+    def resume(self, context, name, **attributes):
+        """Open a span under a trace position captured in another thread"""
+        token = _current.set(context)
+        try:
+            if context is None:
+                yield
+            else:
+                with self.span(name, **attributes):
+                    yield
+        finally:
+            _current.reset(token)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Time a block as a child of the current span; free outside sampled traces"""
+        current = _current.get()
+        if current is None:
+            yield
+            return
+
+        trace_id, parent_id = current
+        span_id = uuid.uuid4().hex[:16]
+        token = _current.set((trace_id, span_id))
+        thread_id = threading.get_ident()
+        outer_name = active_spans.get(thread_id)
+        active_spans[thread_id] = name
+        start = time.time()
+        started = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = f'{type(e).__name__}: {e}'
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            _current.reset(token)
+            if outer_name is None:
+                active_spans.pop(thread_id, None)
+            else:
+                active_spans[thread_id] = outer_name
+            record = {
+                'trace_id': trace_id,
+                'span_id': span_id,
+                'parent_id': parent_id,
+                'name': name,
+                'start': round(start, 6),
+                'duration_ms': round(duration * 1e3, 3),
+                'thread': threading.current_thread().name,
+            }
+            if attributes:
+                record['attributes'] = attributes
+            if error:
+                record['error'] = error
+            self.exporter.export(record)
+
+
+tracer = Tracer()
+
+
+def configure(path, sample_rate=1.0, max_bytes=50 * 1024 * 1024):
+    """Start exporting sampled traces to a JSON lines file"""
+    exporter = TraceExporter(path, max_bytes=max_bytes)
+    exporter.start()
+    tracer.exporter = exporter
+    tracer.sample_rate = sample_rate
+    return tracer
+
+
+def start_trace(name, trace_id=None, **attributes):
+    return tracer.start_trace(name, trace_id=trace_id, **attributes)
+
+
+def span(name, **attributes):
+    return tracer.span(name, **attributes)
+
+
+def current_trace_id():
+    current = _current.get()
+    return current[0] if current else None
+
+
+def traced(name=None):
+    """Decorator recording each call of the function as a span"""
+    def decorate(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return func(*args, **kwargs)
+            with tracer.span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def traced_event(name):
+    """Decorator starting a trace per LINE webhook event, keyed by its webhook event ID"""
+    def decorate(func):
+        # The SDK passes extra arguments to handlers that accept them, so take only the event
+        @functools.wraps(func)
+        def wrapper(event):
+            trace_id = getattr(event, 'webhook_event_id', None)
+            with tracer.start_trace(name, trace_id=trace_id, user_id=getattr(event.source, 'user_id', None)):
+                return func(event)
+        return wrapper
+    return decorate
+
+
+def continue_trace(func, name=None):
+    """Wrap func to run as a span of the current trace in whatever thread calls it.
+
+    Threads do not inherit the current trace, so work handed to a queue
+    or pool is wrapped before it is submitted.
+    """
+    context = _current.get()
+    if context is None:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with tracer.resume(context, name or func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,141 @@
+import math
+import threading
+
+# Metrics worth forecasting: soil dries out and rooms heat up or cool down steadily
+TREND_METRICS = ('moisture', 'temperature')
+
+DEFAULT_HALF_LIFE_SECONDS = 3 * 3600
+
+
+class MetricTrend:
+    """Online level and slope estimate of one metric, O(1) time and memory per reading.
+
+    The level is a time-aware EWMA of the values. The slope comes from a
+    linear regression with exponentially decaying weights, kept as five
+    running sums that are decayed and re-centred on the newest reading at
+    each update. Both forget old readings with the same half-life, so a
+    plant that was just watered stops looking like it is drying out
+    within a few half-lives.
+    """
+
+    __slots__ = ('half_life', 'level', 'last_ts', '_w', '_wt', '_wv', '_wtt', '_wtv', 'first_ts')
+
+    def __init__(self, half_life=DEFAULT_HALF_LIFE_SECONDS):
+        self.half_life = half_life
+        self.level = None
+        self.last_ts = None
+        self.first_ts = None
+        # Weighted sums of 1, t, v, t², t·v with t relative to last_ts
+        self._w = self._wt = self._wv = self._wtt = self._wtv = 0.0
+
+    def update(self, ts, value):
+        if self.last_ts is None:
+            self.level = value
+            self.first_ts = ts
+        elif ts <= self.last_ts:
+            return
+        else:
+            dt = ts - self.last_ts
+            decay = 0.5 ** (dt / self.half_life)
+            self.level = decay * self.level + (1 - decay) * value
+            # Decay, then move the origin to ts (every old t becomes t - dt)
+            w, wt, wv, wtt, wtv = (s * decay for s in (self._w, self._wt, self._wv, self._wtt, self._wtv))
+            self._w = w
+            self._wt = wt - dt * w
+            self._wv = wv
+            self._wtt = wtt - 2 * dt * wt + dt * dt * w
+            self._wtv = wtv - dt * wv
+        self.last_ts = ts
+        # The new reading sits at t = 0, so it only adds to the weight and value sums
+        self._w += 1.0
+        self._wv += value
+
+    @property
+    def weight(self):
+        """Effective number of readings behind the estimate"""
+        return self._w
+
+    @property
+    def slope(self):
+        """Units per second, or None until the readings span some time"""
+        if self._w < 2:
+            return None
+        mean_t = self._wt / self._w
+        variance = self._wtt / self._w - mean_t * mean_t
+        if variance <= 1e-9:
+            return None
+        return (self._wtv / self._w - mean_t * self._wv / self._w) / variance
+
+    def seconds_until(self, bound):
+        """Seconds until the fitted line reaches bound, or None if it is heading away"""
+        slope = self.slope
+        if not slope:
+            return None
+        # Value of the fitted line now; unlike the EWMA it does not lag behind a trend
+        current = (self._wv - slope * self._wt) / self._w
+        seconds = (bound - current) / slope
+        return seconds if seconds > 0 else None
+
+
+class TrendTracker:
+    """MetricTrend estimators per plant, updated once per reading.
+
+    forecast() projects each trend against the plant's thresholds, so
+    predicting a breach costs the same whatever the length of the history.
+    """
+
+    def __init__(self, metrics=TREND_METRICS, half_life=DEFAULT_HALF_LIFE_SECONDS,
+                 min_readings=4, min_span_seconds=1800):
+        self.metrics = tuple(metrics)
+        self.half_life = half_life
+        self.min_readings = min_readings
+        self.min_span_seconds = min_span_seconds
+        self._trends = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, plant_id):
+        return plant_id in self._trends
+
+    def update(self, plant_id, reading):
+        """Fold one reading with an epoch 'ts' field into the plant's trends"""
+        with self._lock:
+            trends = self._trends.get(plant_id)
+            if trends is None:
+                trends = self._trends[plant_id] = {metric: MetricTrend(self.half_life) for metric in self.metrics}
+        for metric, trend in trends.items():
+            value = reading.get(metric)
+            if isinstance(value, (int, float)) and not math.isnan(value):
+                trend.update(reading['ts'], value)
+
+    def remove(self, plant_id):
+        with self._lock:
+            self._trends.pop(plant_id, None)
+
+    def get(self, plant_id, metric):
+        return self._trends.get(plant_id, {}).get(metric)
+
+    def forecast(self, plant_id, thresholds, horizon_seconds):
+        """Predicted breaches within horizon_seconds as [(metric, 'low' | 'high', seconds)].
+
+        Metrics already outside their range are left to the threshold
+        check. Trends with too few readings or too short a span are
+        not trusted yet.
+        """
+        forecasts = []
+        for metric, trend in self._trends.get(plant_id, {}).items():
+            limits = (thresholds or {}).get(metric)
+            if not limits or trend.level is None:
+                continue
+            if trend.weight < self.min_readings or trend.last_ts - trend.first_ts < self.min_span_seconds:
+                continue
+            low, high = limits.get('min'), limits.get('max')
+            if low is not None and trend.level > low:
+                seconds = trend.seconds_until(low)
+                if seconds is not None and seconds <= horizon_seconds:
+                    forecasts.append((metric, 'low', seconds))
+                    continue
+            if high is not None and trend.level < high:
+                seconds = trend.seconds_until(high)
+                if seconds is not None and seconds <= horizon_seconds:
+                    forecasts.append((metric, 'high', seconds))
+        return forecasts